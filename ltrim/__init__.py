@@ -1,5 +1,34 @@
-from ltrim.debloat import main as debloat
-from ltrim.delta import main as delta
-from ltrim.moduify import main as moduify
+import importlib
+import sys
 
-all = [debloat, delta, moduify]
+# The entry points are imported on first use, so that importing a single
+# subpackage (e.g. ltrim.moduify from the delta driver) does not set up the
+# whole debloater
+_entry_points = {
+    "bench": "ltrim.bench",
+    "debloat": "ltrim.debloat",
+    "delta": "ltrim.delta",
+    "moduify": "ltrim.moduify",
+    "profiler": "ltrim.profiler",
+}
+
+__all__ = list(_entry_points) + ["main"]
+
+
+def __getattr__(name):
+    if name in _entry_points:
+        return importlib.import_module(_entry_points[name]).main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main():
+    """
+    Run the entry point named by the first argument, e.g. `ltrim bench app.py`,
+    or the debloater if the first argument is not an entry point
+    """
+    command = "debloat"
+    if len(sys.argv) > 1 and sys.argv[1] in _entry_points:
+        command = sys.argv.pop(1)
+        sys.argv[0] = f"ltrim {command}"
+
+    __getattr__(command)()
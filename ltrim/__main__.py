@@ -1,3 +1,3 @@
-from ltrim import debloat
+from ltrim import main
 
-debloat()
+main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+
+from ltrim.bench.bench import (
+    benchmark,
+    format_summary,
+    original_modules,
+    percentile,
+    run_benchmarks,
+    summarize,
+)
+from ltrim.utils import MB, Config
+
+__all__ = [
+    "benchmark",
+    "format_summary",
+    "original_modules",
+    "percentile",
+    "run_benchmarks",
+    "summarize",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="ltrim bench",
+        description="""Benchmark the cold starts and warm invocations of a
+        Python application. Every run starts a fresh interpreter, loads the
+        application, invokes the handler on the first test case and then on
+        the test cases in turn.""",
+    )
+    parser.add_argument("filename", type=str, help="Name of the application")
+    parser.add_argument(
+        "-t",
+        "--testcases",
+        type=str,
+        default="data.json",
+        help="Path to the testcases file.",
+    )
+    parser.add_argument(
+        "--handler",
+        default="handler",
+        help="""The name of the function handler.
+        This should be the entry point of the application""",
+    )
+    parser.add_argument(
+        "-n", "--runs", type=int, default=20, help="Number of cold starts."
+    )
+    parser.add_argument(
+        "-w",
+        "--warm",
+        type=int,
+        default=10,
+        help="Number of warm invocations after every cold start.",
+    )
+    parser.add_argument(
+        "-m",
+        "--memory-limit",
+        type=int,
+        default=None,
+        help="""Limit the address space of every run to this many MB, like the
+        memory setting of a serverless function. Runs that exceed it fail.""",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="""Also benchmark the application with the backups of the
+        debloated modules in tmp/, i.e. before debloating.""",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="Write the summaries to this JSON file."
+    )
+
+    args = parser.parse_args()
+
+    config = Config(
+        appname=args.filename, handler=args.handler, test_cases=args.testcases
+    )
+    max_memory = args.memory_limit * MB if args.memory_limit else None
+
+    summaries = run_benchmarks(
+        config, args.runs, args.warm, max_memory=max_memory, compare=args.compare
+    )
+    print(format_summary(summaries))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
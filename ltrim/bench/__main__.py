@@ -0,0 +1,3 @@
+from ltrim.bench import main
+
+main()
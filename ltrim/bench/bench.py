@@ -0,0 +1,276 @@
+import json
+import math
+import os
+import py_compile
+import resource
+import subprocess
+import time
+
+from ltrim.delta.utils import PyLambdaRunner, driver_status
+from ltrim.utils import MB, MS, cmd_message
+
+# Directory of the backups of the original modules, see Moduify
+BACKUP_DIR = "tmp"
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of values
+
+    :param values: The values
+    :param q: The percentile, between 0 and 100
+    :return: The percentile, or None if there are no values
+    """
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def original_modules(backup_dir=BACKUP_DIR):
+    """
+    Overrides that load the backups of the debloated modules, i.e. the
+    application as it was before debloating
+
+    :param backup_dir: The directory of the backups
+    :return: A dictionary from module names to the paths of their backups
+    """
+    overrides = {}
+    if not os.path.isdir(backup_dir):
+        return overrides
+
+    for module_name in os.listdir(backup_dir):
+        directory = os.path.join(backup_dir, module_name)
+        if not os.path.isdir(directory):
+            continue
+
+        # The backup is the only source file next to the working directories
+        for entry in os.listdir(directory):
+            if entry.endswith(".py"):
+                overrides[module_name] = os.path.abspath(os.path.join(directory, entry))
+
+    return overrides
+
+
+def compile_backups(overrides):
+    """
+    Compile the backups to hash-checked bytecode next to them, which the
+    driver loads instead of compiling them on every cold start, like the
+    bytecode of the installed modules
+
+    :param overrides: A dictionary from module names to the paths of the
+        backups, see original_modules
+    """
+    for path in overrides.values():
+        try:
+            py_compile.compile(
+                path,
+                doraise=True,
+                invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+            )
+        except py_compile.PyCompileError as e:
+            cmd_message(f"Cannot compile the backup {path}: {e.msg}", "warning")
+
+
+def limit_memory(max_memory):
+    """
+    Function that limits the address space of a child process before it
+    executes the interpreter, so that the limit covers the startup of the
+    interpreter too, like the memory setting of a serverless function
+
+    :param max_memory: The limit in bytes
+    """
+
+    def limit():
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = max_memory if hard == resource.RLIM_INFINITY else min(max_memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+    return limit
+
+
+def cold_start(runner, warm, max_memory=None, overrides=None):
+    """
+    Start the application in a fresh interpreter, invoke the handler once and
+    then `warm` more times
+
+    :param runner: The runner of the application
+    :param warm: The number of warm invocations
+    :param max_memory: The limit of the address space of the interpreter in
+        bytes, or None for no limit
+    :param overrides: A dictionary from module names to paths of sources that
+        are imported instead of the installed modules
+    :return: The cold-start time from the start of the interpreter to the end
+        of the first invocation, the time to load the application and of the
+        first invocation, the warm latencies in seconds and the peak memory,
+        or the reason if the run failed
+    """
+    request = {"overrides": overrides or {}}
+
+    start = time.time()
+    process = subprocess.run(
+        runner.command("--request", "--bench", str(warm)),
+        input=json.dumps(request).encode("utf-8"),
+        capture_output=True,
+        preexec_fn=limit_memory(max_memory) if max_memory is not None else None,
+    )
+    status = driver_status(process)
+
+    if process.returncode != 0 or "cold_end" not in status:
+        # An interpreter that runs out of memory while starting up does not
+        # get to write its status
+        reason = status.get("reason")
+        if reason is None:
+            reason = "memory" if b"MemoryError" in process.stderr else "exception"
+        return {"failed": reason}
+
+    return {
+        "cold": status["cold_end"] - start,
+        "load": status["load"],
+        "first": status["first"],
+        "warm": status["warm"],
+        "max_rss": status.get("max_rss"),
+    }
+
+
+def benchmark(config, runs=20, warm=10, max_memory=None, overrides=None):
+    """
+    Benchmark the cold starts and warm invocations of the application. The
+    runs are sequential, so that they do not compete for the CPU.
+
+    :param config: The configuration of the application
+    :param runs: The number of cold starts
+    :param warm: The number of warm invocations after every cold start
+    :param max_memory: The limit of the address space of every run in bytes,
+        or None for no limit
+    :param overrides: A dictionary from module names to paths of sources that
+        are imported instead of the installed modules
+    :return: The summary of the runs, see summarize
+    """
+    runner = PyLambdaRunner(config)
+
+    results = []
+    for _ in range(runs):
+        results.append(cold_start(runner, warm, max_memory, overrides))
+
+    return summarize(results)
+
+
+def summarize(results):
+    """
+    Summarize the runs of a benchmark with the p50, p95 and p99 of the
+    cold-start time, the load time, the first and the warm invocation
+    latencies, and the peak resident set size, in milliseconds and MB
+
+    :param results: The results of the runs, see cold_start
+    """
+    passed = [r for r in results if "failed" not in r]
+
+    samples = {
+        "cold": [r["cold"] / MS for r in passed],
+        "load": [r["load"] / MS for r in passed],
+        "first": [r["first"] / MS for r in passed],
+        "warm": [w / MS for r in passed for w in r["warm"]],
+        "max_rss": [r["max_rss"] / MB for r in passed if r["max_rss"] is not None],
+    }
+
+    summary = {
+        "runs": len(results),
+        "failed": len(results) - len(passed),
+        "reasons": sorted({r["failed"] for r in results if "failed" in r}),
+    }
+    for metric, values in samples.items():
+        summary[metric] = {f"p{q}": percentile(values, q) for q in (50, 95, 99)} | {
+            "max": max(values, default=None)
+        }
+
+    return summary
+
+
+# Rows of the benchmark table: metric, label and unit
+METRICS = [
+    ("cold", "Cold start", "ms"),
+    ("load", "  Import", "ms"),
+    ("first", "  First invocation", "ms"),
+    ("warm", "Warm invocation", "ms"),
+    ("max_rss", "Peak RSS", "MB"),
+]
+
+
+def format_summary(summaries):
+    """
+    Format one or more benchmark summaries as a table, with the p50, p95 and
+    p99 of every metric and the change of the p50 if there are exactly two
+    summaries
+
+    :param summaries: A dictionary from names, e.g. before and after, to the
+        summaries of their benchmarks
+    """
+
+    def cell(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    names = list(summaries)
+    header = f"{'':<26}" + "".join(f"{name:>26}" for name in names)
+    if len(names) == 2:
+        header += f"{'p50 change':>14}"
+
+    lines = [header, f"{'':<26}" + f"{'p50 / p95 / p99':>26}" * len(names)]
+    for metric, label, unit in METRICS:
+        line = f"{label + ' (' + unit + ')':<26}"
+        for name in names:
+            values = summaries[name][metric]
+            line += f"{' / '.join(cell(values[f'p{q}']) for q in (50, 95, 99)):>26}"
+
+        if len(names) == 2:
+            before, after = (summaries[name][metric]["p50"] for name in names)
+            if before and after is not None:
+                line += f"{(after - before) / before:>+14.1%}"
+        lines.append(line)
+
+    for name in names:
+        summary = summaries[name]
+        if summary["failed"]:
+            lines.append(
+                f"{name}: {summary['failed']} of {summary['runs']} runs failed "
+                f"({', '.join(summary['reasons'])})"
+            )
+
+    return "\n".join(lines)
+
+
+def run_benchmarks(config, runs, warm, max_memory=None, compare=False):
+    """
+    Benchmark the installed application and, to compare, the application with
+    the backups of the debloated modules
+
+    :param config: The configuration of the application
+    :param runs: The number of cold starts
+    :param warm: The number of warm invocations after every cold start
+    :param max_memory: The limit of the address space of every run in bytes,
+        or None for no limit
+    :param compare: Whether to also benchmark the original modules
+    :return: A dictionary from before and after to the summaries
+    """
+    summaries = {}
+
+    if compare:
+        overrides = original_modules()
+        if not overrides:
+            cmd_message(f"No backups of debloated modules in {BACKUP_DIR}/", "warning")
+        else:
+            compile_backups(overrides)
+            cmd_message(
+                f"Benchmarking {runs} cold starts with the original "
+                f"{', '.join(sorted(overrides))}..."
+            )
+            summaries["before"] = benchmark(config, runs, warm, max_memory, overrides)
+
+    cmd_message(f"Benchmarking {runs} cold starts...")
+    summaries["after" if summaries else "installed"] = benchmark(
+        config, runs, warm, max_memory
+    )
+
+    return summaries
@@ -1,8 +1,25 @@
 import argparse
 
+from ltrim.debloat.cache import CACHE_DIR
 from ltrim.debloat.debloat import Debloater
+from ltrim.debloat.scoring import (
+    SCORING_METHODS,
+    GBSecondModel,
+    ModuleCost,
+    load_scoring,
+)
+from ltrim.delta.strategies import STRATEGIES
 from ltrim.utils import Config
 
+__all__ = [
+    "Debloater",
+    # Scoring
+    "GBSecondModel",
+    "ModuleCost",
+    "SCORING_METHODS",
+    "load_scoring",
+]
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -31,8 +48,54 @@ def main():
         "-s",
         "--scoring",
         default="cost",
-        choices=["cost", "time", "memory", "random", "custom"],
-        help="The scoring method to calculate the top K ranking of the modules.",
+        help="""The scoring method to calculate the top K ranking of the
+        modules: cost, time, memory, random, gb-second, the name of an entry
+        point in the ltrim.scoring group, or the path of a scoring function,
+        as module:function.""",
+    )
+
+    parser.add_argument(
+        "--profile-runs",
+        type=int,
+        default=1,
+        help="""Number of profiling runs to rank the modules by. The runs
+        are isolated and run in parallel, and the modules are ranked by the
+        median of the runs, with a warning if the top K is uncertain.""",
+    )
+
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="""Wall-clock budget of debloating in minutes. Instead of the top
+        K, the modules with the highest expected savings that fit in the
+        budget are debloated, ordered by their savings per minute.""",
+    )
+
+    parser.add_argument(
+        "--target-time",
+        type=float,
+        default=None,
+        help="""Stop once this percentage of the import time is saved. The
+        modules are chosen as with --budget.""",
+    )
+
+    parser.add_argument(
+        "--target-memory",
+        type=float,
+        default=None,
+        help="""Stop once this percentage of the import memory is saved. The
+        modules are chosen as with --budget.""",
+    )
+
+    parser.add_argument(
+        "--memory-tracking",
+        default="rss",
+        choices=["rss", "tracemalloc"],
+        help="""How the profiler measures the memory of every module: the
+        change of the resident set size, or the Python memory traced by
+        tracemalloc, together with the native libraries that the module maps
+        in a separate column.""",
     )
 
     parser.add_argument(
@@ -43,6 +106,30 @@ def main():
         This should be the entry point of the application""",
     )
 
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="""Debloat every module of the top K packages that the
+        application loads, including the submodules that only the test cases
+        import, ordered by their score.""",
+    )
+
+    parser.add_argument(
+        "--no-dominators",
+        action="store_true",
+        help="""Score every module by its own import time and memory only,
+        instead of including the modules that only it imports.""",
+    )
+
+    parser.add_argument(
+        "--no-attribute-tracing",
+        action="store_true",
+        help="""Do not trace the attributes that the test cases read from
+        every module. By default, they are kept without Delta Debugging
+        deciding on them.""",
+    )
+
     # Disable PyCG flag
     parser.add_argument(
         "--no-pycg",
@@ -52,13 +139,119 @@ def main():
         process.""",
     )
 
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=CACHE_DIR,
+        help=f"""Directory of the cache of PyCG call graphs, which are reused
+        for the same application source and installed packages (default:
+        {CACHE_DIR}).""",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run PyCG, without reading or writing the cache.",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="""Number of oracle checks to run in parallel during
+        Delta Debugging. Each worker uses its own copy of the module.""",
+    )
+
+    parser.add_argument(
+        "--fork-server",
+        action="store_true",
+        help="""Run the oracle checks in processes forked from a server
+        that has already imported the dependencies of the application.""",
+    )
+
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="""Compile the candidate modules in memory and hand the code
+        to the application, instead of rewriting the installed module for
+        every oracle check.""",
+    )
+
+    parser.add_argument(
+        "--no-groups",
+        action="store_true",
+        help="""Do not group attributes that reference each other
+        before Delta Debugging. This will result in more oracle checks.""",
+    )
+
+    parser.add_argument(
+        "--strategy",
+        default="ddmin",
+        choices=list(STRATEGIES),
+        help="""The minimization strategy of Delta Debugging. probdd learns
+        which attributes are likely needed from the outcomes of the oracle,
+        hdd decides on whole imported modules and classes first, and
+        binary-elim removes chunks of attributes and splits the failing ones.""",
+    )
+
+    parser.add_argument(
+        "--timeout-factor",
+        type=float,
+        default=10.0,
+        help="""Stop an oracle check that runs this many times longer than
+        the original application. Set to 0 to disable.""",
+    )
+
+    parser.add_argument(
+        "--memory-factor",
+        type=float,
+        default=2.0,
+        help="""Limit the address space of an oracle check to this multiple
+        of the peak virtual memory of the original application. Set to 0 to
+        disable.""",
+    )
+
+    parser.add_argument(
+        "--lazy-imports",
+        action="store_true",
+        help="""After debloating a module, import the modules behind its
+        kept attributes on first access, if the application does not need
+        them before its handler is invoked.""",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="""Resume an interrupted run from the checkpoints in the
+        log/checkpoint directory, instead of starting from scratch.""",
+    )
+
     args = parser.parse_args()
 
+    try:
+        load_scoring(args.scoring)
+    except ValueError as e:
+        parser.error(str(e))
+
+    scheduled = [args.budget, args.target_time, args.target_memory]
+    if args.recursive and any(value is not None for value in scheduled):
+        parser.error("--budget and the targets cannot be used with --recursive")
+
     # create a configuration
     config = Config(
         appname=args.filename,
         handler=args.handler,
         test_cases=args.testcases,
+        jobs=args.jobs,
+        fork_server=args.fork_server,
+        in_memory=args.in_memory,
+        group_attributes=not args.no_groups,
+        strategy=args.strategy,
+        timeout_factor=args.timeout_factor,
+        memory_factor=args.memory_factor,
+        resume=args.resume,
+        lazy_imports=args.lazy_imports,
     )
 
     debloater = Debloater(
@@ -66,6 +259,17 @@ def main():
         top_K=args.top_K,
         scoring=args.scoring,
         disable_pycg=args.no_pycg,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        recursive=args.recursive,
+        dominators=not args.no_dominators,
+        trace_attributes=not args.no_attribute_tracing,
+        memory=args.memory_tracking,
+        profile_runs=max(1, args.profile_runs),
+        budget=args.budget * 60 if args.budget is not None else None,
+        target_time=args.target_time / 100 if args.target_time is not None else None,
+        target_memory=(
+            args.target_memory / 100 if args.target_memory is not None else None
+        ),
     )
 
     debloater.run()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import sys
+from importlib.metadata import PackageNotFoundError, distributions, version
+
+from ltrim.delta.cache import file_digest
+
+# Default directory of the cache, shared by every application
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ltrim"
+)
+
+
+# Directories next to the application that hold no sources of it: the logs
+# and the backups of ltrim, and caches
+SKIPPED_DIRS = {"log", "tmp", "__pycache__", "node_modules"}
+
+
+def local_sources(directory):
+    """
+    The Python files in a directory and in its subdirectories, i.e. the local
+    modules and packages that an application in it can import. Hidden
+    directories and virtual environments are skipped.
+
+    :param directory: The directory of the application
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(
+            name
+            for name in dirs
+            if name not in SKIPPED_DIRS
+            and not name.startswith(".")
+            and not os.path.exists(os.path.join(root, name, "pyvenv.cfg"))
+        )
+        for name in sorted(files):
+            if name.endswith(".py"):
+                yield os.path.join(root, name)
+
+
+def distribution_digests(distribution):
+    """
+    The content digests of the Python files of an installed distribution.
+    They come from its RECORD, without reading the files, unless a file was
+    changed after the distribution was installed, e.g. debloated, or has no
+    recorded hash, which is then hashed. Reinstalling the same version gives
+    the same digests.
+
+    :param distribution: The distribution
+    :return: A list of (path, digest) pairs
+    """
+    files = distribution.files or []
+
+    # RECORD is written last when a distribution is installed
+    installed = None
+    for file in files:
+        if file.name == "RECORD" and file.parent.name.endswith(".dist-info"):
+            try:
+                installed = os.stat(distribution.locate_file(file)).st_mtime_ns
+            except OSError:
+                pass
+
+    digests = []
+    for file in files:
+        if file.suffix != ".py":
+            continue
+
+        path = distribution.locate_file(file)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        changed = (
+            file.hash is None
+            or stat.st_size != file.size
+            or installed is None
+            or stat.st_mtime_ns > installed
+        )
+        digests.append((str(file), file_digest(path) if changed else file.hash.value))
+
+    return digests
+
+
+def environment_digest(appname):
+    """
+    Digest of everything a static analysis of an application depends on: the
+    source of the application, the local modules next to it, the Python
+    version, and the version and the Python files of every installed
+    distribution. The test cases are not part of it.
+
+    :param appname: The path of the application
+    """
+    context = hashlib.sha256()
+    context.update(sys.version.encode() + b"\0")
+
+    directory = os.path.dirname(os.path.abspath(appname))
+    context.update(os.path.relpath(os.path.abspath(appname), directory).encode())
+    for path in local_sources(directory):
+        relative = os.path.relpath(path, directory)
+        context.update(f"{relative}\0{file_digest(path)}\0".encode())
+
+    installed = {}
+    for distribution in distributions():
+        name = distribution.metadata["Name"]
+        if name and name not in installed:
+            installed[name] = distribution
+
+    for name in sorted(installed):
+        distribution = installed[name]
+        context.update(f"{name}\0{distribution.version}\0".encode())
+        for path, digest in distribution_digests(distribution):
+            context.update(f"{path}\0{digest}\0".encode())
+
+    return context.hexdigest()
+
+
+class CallGraphCache:
+    """
+    On-disk cache of the PyCG call graphs of applications, together with
+    their prefix index, i.e. the attributes of every module that filter_pycg
+    returns. An entry is only reused for the same application source in the
+    same environment, see environment_digest, so a run with other test cases
+    or a rerun after an interruption skips PyCG.
+
+    :param directory: The directory of the cache
+    """
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = os.path.join(directory, "pycg")
+
+    def key(self, appname):
+        """
+        Key of the entry of an application in the current environment
+
+        :param appname: The path of the application
+        """
+        context = hashlib.sha256(environment_digest(appname).encode())
+        try:
+            context.update(version("pycgl").encode())
+        except PackageNotFoundError:
+            pass
+        return context.hexdigest()
+
+    def load(self, key):
+        """
+        Read an entry, or return None if there is none
+
+        :param key: The key of the entry
+        :return: The call graph and its prefix index
+        """
+        try:
+            with open(f"{self.directory}/{key}.json", "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry["call_graph"], entry["index"]
+
+    def save(self, key, call_graph, index):
+        """
+        Write an entry atomically, so that runs in parallel never read a
+        partial entry
+
+        :param key: The key of the entry
+        :param call_graph: The call graph
+        :param index: The prefix index of the call graph
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = f"{self.directory}/{key}.json"
+        with open(f"{path}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"call_graph": call_graph, "index": index}, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
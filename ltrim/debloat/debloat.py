@@ -1,28 +1,57 @@
 import ast
 import logging
+import os
 import sys
+import time
 from pprint import pformat as pp
 
-from ltrim.debloat.process import debloat, run_profiler, run_pycg
+from ltrim.debloat.cache import CACHE_DIR, CallGraphCache
+from ltrim.debloat.process import (
+    debloat,
+    oracle_latency,
+    profile_imports,
+    run_attribute_tracer,
+    run_profiler,
+    run_pycg,
+    run_tracer,
+)
+from ltrim.debloat.scheduler import Scheduler, import_cost, realized_yield
 from ltrim.debloat.utils import (
     blacklist,
+    exclusive_costs,
+    expand_packages,
     filter_pycg,
+    import_graph,
+    index_pycg,
+    next_module,
+    package_of,
+    rescore,
     sort_report,
+    unstable_modules,
     update_alive_modules,
 )
+from ltrim.profiler import (
+    diff_reports,
+    diff_stacks,
+    export_report,
+    format_diff,
+    load_report,
+)
 from ltrim.transformers import ImportsFinder
-from ltrim.utils import Config, Stats, cmd_message, mkdirp
-
-# Create the log directory if it doesn't exist
-mkdirp("log")
+from ltrim.utils import (
+    Config,
+    Stats,
+    cmd_message,
+    load_checkpoint,
+    mkdirp,
+    reachable,
+    save_checkpoint,
+)
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    filename="log/debloat.log",
-    filemode="w",
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
+
+# Directory of the import profiles before and after debloating
+PROFILE_DIR = "log/profile"
 
 
 class Debloater:
@@ -32,6 +61,23 @@ class Debloater:
     :param filename: The name of the application to debloat
     :param top_k: The number of modules to debloat
     :param scoring: The scoring method to calculate the top K ranking of the modules
+    :param recursive: If set, debloat every module of the top K packages that
+        the application loads, instead of the top K modules
+    :param dominators: If set, score every module by its exclusive costs, i.e.
+        including the modules that only it imports
+    :param memory: How the profiler measures memory, "rss" or "tracemalloc"
+    :param profile_runs: The number of profiling runs to combine
+    :param budget: If set, the wall-clock budget of debloating in seconds.
+        The modules are chosen to maximize the expected savings within it,
+        instead of the top K
+    :param target_time: If set, stop once this fraction of the import time
+        is saved
+    :param target_memory: If set, stop once this fraction of the import
+        memory is saved
+    :param trace_attributes: If set, keep the attributes that the test cases
+        read from a module, without Delta Debugging deciding on them
+    :param cache_dir: The directory of the cache of PyCG call graphs, or None
+        to always run PyCG
     """
 
     def __init__(
@@ -40,15 +86,59 @@ class Debloater:
         top_K,
         scoring,
         disable_pycg,
+        recursive=False,
+        dominators=True,
+        memory="rss",
+        profile_runs=1,
+        budget=None,
+        target_time=None,
+        target_memory=None,
+        trace_attributes=True,
+        cache_dir=CACHE_DIR,
     ):
         self.config = config
         self.appname = config.appname
         self.top_K = top_K
         self.scoring = scoring
+        self.recursive = recursive
+        self.dominators = dominators
+        self.memory = memory
+        self.profile_runs = profile_runs
+        self.budget = budget
+        self.target_time = target_time
+        self.target_memory = target_memory
+        self.trace_attributes = trace_attributes
+        self.cache_dir = cache_dir
+        self.scheduled = any(
+            value is not None for value in (budget, target_time, target_memory)
+        )
         self.stats = Stats(self.appname, self.top_K)
         self.pycg = not disable_pycg
 
-    def run(self):
+        # Create the log directory, keeping the logs and the checkpoints of an
+        # interrupted run when resuming it
+        if config.resume:
+            os.makedirs("log", exist_ok=True)
+        else:
+            mkdirp("log")
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+
+        logging.basicConfig(
+            filename="log/debloat.log",
+            filemode="a" if config.resume else "w",
+            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+            level=logging.INFO,
+        )
+
+    def analyze(self):
+        """
+        Find the modules that the application imports, extract its call graph
+        and rank the modules by their score
+
+        :return: The modules to profile, the prefix index of the call graph,
+            the profiling report, the ranked modules and the total import time
+            and memory
+        """
         with open(self.appname, "r") as f:
             source = f.read()
 
@@ -65,14 +155,25 @@ class Debloater:
         cmd_message("Imports found!", "success")
         logger.info(f"Imports found: {imports_finder.imports}")
 
-        # Step 2: Use PyCG to extract the call graph of the application
+        # Step 2: Use PyCG to extract the call graph of the application, or
+        # reuse the one of an earlier run in the same environment
+        pycg_index = {}
         if sys.version_info.minor <= 10 and self.pycg:
-            cmd_message("Extracting call graph...")
-            call_graph = run_pycg(self.appname)
-            cmd_message("Call graph extracted!", "success")
+            cache = CallGraphCache(self.cache_dir) if self.cache_dir else None
+            key = cache.key(self.appname) if cache is not None else None
+            cached = cache.load(key) if cache is not None else None
+
+            if cached is not None:
+                call_graph, pycg_index = cached
+                cmd_message("Call graph loaded from the cache!", "success")
+            else:
+                cmd_message("Extracting call graph...")
+                call_graph = run_pycg(self.appname)
+                pycg_index = index_pycg(call_graph)
+                if cache is not None:
+                    cache.save(key, call_graph, pycg_index)
+                cmd_message("Call graph extracted!", "success")
             logger.info(f"Call graph extracted: {call_graph}")
-        else:
-            call_graph = []
 
         # --------------------------------------------------------------------- #
         # ------------------------ Constructing Phase ------------------------- #
@@ -82,74 +183,348 @@ class Debloater:
         imported_modules = []
 
         for module_name in imports_finder.imports:
-            if module_name in blacklist:
+            if package_of(module_name) in blacklist:
                 continue
 
             imported_modules.append(module_name)
 
         logger.info(f"Filtered imports: {imported_modules}")
 
+        # Step 3.1: In recursive mode, also profile the submodules that only
+        # the handler imports while running the test cases
+        profiled_modules = imported_modules
+        if self.recursive:
+            cmd_message("Tracing the modules loaded by the test cases...")
+            loaded_modules = run_tracer(self.config)
+            profiled_modules = imported_modules + [
+                module
+                for module in loaded_modules
+                if module not in imported_modules
+                and package_of(module) not in blacklist
+            ]
+            logger.info(f"Modules loaded by the test cases: {loaded_modules}")
+
         # --------------------------------------------------------------------- #
         # ------------------------- Profiling Phase --------------------------- #
         # --------------------------------------------------------------------- #
 
-        # Step 4: Profile the import process of the application
+        # Step 4: Profile the import process of the application, and record
+        # which modules every module imports
         cmd_message("Profiling the import process...")
-        report = run_profiler(imported_modules)
+        report = profile_imports(
+            profiled_modules, self.memory, self.profile_runs, graph=True
+        )
+        graph = import_graph(report)
+        export_report(report, PROFILE_DIR + "/before")
 
         # Extract the total memory used by the imported modules
         total_memory = report["total_memory"]
         del report["total_memory"]
 
-        # Extract the total time taken to import modules
+        # Extract the total time taken to import modules, i.e. the time of the
+        # imports that no other import is nested in
         total_time = sum(
-            [report[module]["time"] for module in imported_modules if module in report]
+            entry["time"] for entry in report.values() if entry["parent"] is None
         )
 
         cmd_message(f"Total memory used in the import process: {total_memory:.2f}MB")
         cmd_message(f"Total time taken for the import process: {total_time:.2f}ms")
 
-        # Step 5 - Sort the profiler report using the scoring method
-        sorted_report = sort_report(report, self.scoring, total_time, total_memory)
+        # Step 5 - Sort the profiler report using the scoring method. Every
+        # module is credited with the modules that only it imports
+        if self.dominators:
+            exclusive_costs(report, graph, profiled_modules)
+
+        sorted_report = sort_report(
+            report, self.scoring, total_time, total_memory, self.dominators, graph
+        )
 
         # Filter modules in the blacklist
         sorted_report = [
-            module for module in sorted_report if module[0] not in blacklist
+            module for module in sorted_report if package_of(module[0]) not in blacklist
         ]
-        logger.info(pp(sorted_report[: self.top_K]))
+
+        # Step 5.1 - In recursive mode, rank the submodules of the top K
+        # packages, so that the most expensive ones are debloated first.
+        # Otherwise, keep the whole ranking, so that the top K can change as
+        # modules are debloated
+        if self.recursive:
+            ranking = expand_packages(sorted_report, loaded_modules, self.top_K)
+        else:
+            ranking = sorted_report
+
+            # Warn if the top K depends on the noise of the measurements
+            unstable = unstable_modules(
+                sorted_report,
+                self.scoring,
+                self.top_K,
+                total_time,
+                total_memory,
+                self.dominators,
+                graph,
+                report,
+            )
+            if unstable:
+                logger.warning(f"Modules with uncertain ranking: {unstable}")
+                cmd_message(
+                    f"The top {self.top_K} ranking is not stable across "
+                    f"{self.profile_runs} profiling runs, these modules may "
+                    f"swap places: {', '.join(unstable)}",
+                    "warning",
+                )
+
+        logger.info(pp(ranking))
         cmd_message("Profiling completed!", "success")
 
+        return profiled_modules, pycg_index, report, ranking, (total_time, total_memory)
+
+    def compare_profiles(self, report):
+        """
+        Export the profile after debloating and compare it with the profile
+        before debloating
+
+        :param report: The profiler report after debloating
+        """
+        export_report(report, PROFILE_DIR + "/after")
+        before = load_report(PROFILE_DIR + "/before.json")
+
+        table = format_diff(diff_reports(before, report))
+        with open(PROFILE_DIR + "/diff.txt", "w", encoding="utf-8") as f:
+            f.write(table + "\n")
+        with open(PROFILE_DIR + "/diff.folded", "w", encoding="utf-8") as f:
+            f.write("\n".join(diff_stacks(before, report)) + "\n")
+
+        logger.info("Import profile before and after debloating:\n" + table)
+
+    def checkpoint(self, session):
+        """
+        Checkpoint the state of the debloating session
+
+        :param session: The state of the session
+        """
+        session["stats"] = self.stats.state()
+        save_checkpoint("debloat", session)
+
+    def resume(self):
+        """
+        Return the checkpoint of an interrupted session with the same
+        arguments, or None if there is none
+        """
+        session = load_checkpoint("debloat")
+        if session is None:
+            cmd_message("No checkpoint found, starting from scratch", "warning")
+            return None
+
+        arguments = (self.appname, self.top_K, self.scoring, self.recursive)
+        if (
+            session["appname"],
+            session["top_K"],
+            session["scoring"],
+            session["recursive"],
+        ) != arguments:
+            cmd_message(
+                "The checkpoint belongs to a run with different arguments: "
+                f"{session['appname']}, -k {session['top_K']}, "
+                f"-s {session['scoring']}"
+                + (", --recursive" if session["recursive"] else ""),
+                "error",
+            )
+            sys.exit(1)
+
+        # The costs in the checkpoint were measured and scored with these
+        # settings, and only a scheduled session has the oracle latency and
+        # the import costs before debloating
+        settings = (self.dominators, self.memory, self.scheduled)
+        checkpointed = (
+            session.get("dominators", True),
+            session.get("memory", "rss"),
+            session.get("scheduled", session["latency"] is not None),
+        )
+        if checkpointed != settings:
+            dominators, memory, scheduled = checkpointed
+            cmd_message(
+                "The checkpoint belongs to a run with different settings: "
+                f"--memory-tracking {memory}, "
+                + ("exclusive" if dominators else "self (--no-dominators)")
+                + " costs, "
+                + ("with" if scheduled else "without")
+                + " --budget or a target",
+                "error",
+            )
+            sys.exit(1)
+
+        self.stats.restore(session["stats"])
+        cmd_message(f"Resuming after debloating {len(session['done'])} modules", "info")
+        return session
+
+    def run(self):
+        session = self.resume() if self.config.resume else None
+
+        if session is None:
+            profiled_modules, pycg_index, report, ranking, totals = self.analyze()
+            graph = import_graph(report)
+
+            # In recursive mode, the modules of the top K packages that the
+            # test cases load are alive. Otherwise, every module that the
+            # imports of the application reach in the import graph is
+            if self.recursive:
+                alive_modules = [module for module, _ in ranking]
+            else:
+                alive_modules = sorted(reachable(profiled_modules, graph))
+
+            # The attributes that the test cases read from every module
+            accessed = {}
+            if self.trace_attributes:
+                cmd_message("Tracing the attributes read by the test cases...")
+                accessed = {
+                    module: names
+                    for module, names in run_attribute_tracer(self.config).items()
+                    if package_of(module) not in blacklist
+                }
+                logger.info(f"Attributes read by the test cases: {pp(accessed)}")
+
+            session = {
+                "appname": self.appname,
+                "top_K": self.top_K,
+                "scoring": self.scoring,
+                "recursive": self.recursive,
+                "dominators": self.dominators,
+                "memory": self.memory,
+                "scheduled": self.scheduled,
+                "profiled_modules": profiled_modules,
+                "pycg_index": pycg_index,
+                "accessed": accessed,
+                "graph": graph,
+                # The exclusive costs of the ranked modules and the progress
+                # of the scheduler depend on every module of the report
+                "report": None if self.recursive else report,
+                "ranking": ranking,
+                "limit": None if self.recursive or self.scheduled else self.top_K,
+                "totals": totals,
+                "latency": oracle_latency(self.config) if self.scheduled else None,
+                "scheduler": None,
+                # The import time and memory before debloating, which the
+                # targets of the scheduler are measured against
+                "initial": (
+                    None if self.recursive else import_cost(report, alive_modules)
+                ),
+                "alive_modules": alive_modules,
+                "done": [],
+                # The fraction of the expected saving that debloating every
+                # module achieved
+                "yields": {},
+            }
+            self.checkpoint(session)
+
+        profiled_modules = session["profiled_modules"]
+        # Checkpoints of earlier versions have the call graph instead
+        pycg_index = session.get("pycg_index")
+        if pycg_index is None:
+            pycg_index = index_pycg(session.get("call_graph", []))
+        graph = session["graph"]
+        limit = session["limit"]
+
+        scheduler = None
+        if self.scheduled:
+            scheduler = Scheduler(
+                session["latency"],
+                self.budget,
+                self.target_time,
+                self.target_memory,
+                state=session["scheduler"],
+            )
+            # The report is updated as modules are debloated, so the costs
+            # before debloating come from the start of the session
+            initial = session.get("initial")
+            if initial is None:
+                initial = import_cost(session["report"], session["alive_modules"])
+
         # --------------------------------------------------------------------- #
         # ------------------------- Debloating Phase -------------------------- #
         # --------------------------------------------------------------------- #
 
-        # Step 6 - Debloat the top K modules
-
-        modules_to_debloat = []
-
-        # Initialize a ModuleRecord for stats tracking
-        for module, entry in sorted_report[: self.top_K]:
-            modules_to_debloat.append(module)
+        # Step 6 - Debloat the top K modules, or the modules of the top K
+        # packages in recursive mode. The ranking is updated after every
+        # module, so the next module is the best ranked one that is alive.
+        # With a budget or a target, the scheduler picks the next module
+
+        alive_modules = set(session["alive_modules"])
+
+        # Show the modules that are debloated next unless the ranking
+        # changes, i.e. the rest of the top K, or every module of the top K
+        # packages in recursive mode. The scheduler reports its plan before
+        # every module instead
+        logger.debug(f"Ranking: {pp(session['ranking'])}")
+        if scheduler is None:
+            pending = [
+                (module, entry)
+                for module, entry in session["ranking"]
+                if module in alive_modules and module not in session["done"]
+            ]
+            if limit is not None:
+                pending = pending[: max(0, limit - len(session["done"]))]
+            for module, entry in pending:
+                cmd_message(f"Module {module}: {entry}")
+        total = limit or len(session["ranking"])
+
+        while True:
+            if scheduler is None:
+                module = next_module(
+                    session["ranking"], session["done"], alive_modules, limit
+                )
+                if module is None:
+                    break
+
+                cmd_message(
+                    f"Debloating module {module} ({len(session['done']) + 1}/{total})",
+                    "info",
+                )
+            else:
+                current = import_cost(session["report"], alive_modules)
+                cmd_message(scheduler.progress(initial, current), "info")
+                if scheduler.reached(initial, current):
+                    cmd_message("The savings target is reached!", "success")
+                    break
+
+                plan = scheduler.plan(
+                    session["ranking"], session["done"], alive_modules
+                )
+                logger.info(f"Debloating plan: {plan}")
+                if not plan:
+                    cmd_message("No module left that fits in the budget", "warning")
+                    break
+
+                module, _, estimate = plan[0]
+                cmd_message(
+                    f"Debloating module {module} ({len(session['done']) + 1}, "
+                    f"estimated {estimate / 60:.1f} minutes, "
+                    f"{len(plan) - 1} more planned)",
+                    "info",
+                )
+
+            # Initialize a ModuleRecord for stats tracking
+            entry = dict(session["ranking"])[module]
             self.stats.add_module(module)
-            cmd_message(f"Module {module}: {entry}")
             self.stats.set_profiling_stats(
-                module=module, memory=entry["memory"], time=entry["time"], before=False
+                module=module,
+                memory=entry["memory"],
+                time=entry["time"],
+                before=False,
+                native=entry.get("native", 0),
+                time_variance=entry.get("time_variance", 0),
+                memory_variance=entry.get("memory_variance", 0),
             )
 
-        alive_modules = set(modules_to_debloat)
-
-        for midx, module in enumerate(modules_to_debloat):
-            cmd_message(f"Debloating module {module} ({midx + 1}/{self.top_K})", "info")
-
-            if module not in alive_modules:
-                cmd_message(f"Module {module} is not longer needed!")
-                continue
-
-            # Step 6.1 - Filter the PyCG attributes
-            filtered_attributes = filter_pycg(module, call_graph)
+            # Step 6.1 - Filter the PyCG attributes, and add the attributes
+            # that the test cases read
+            filtered_attributes = filter_pycg(module, pycg_index)
             logger.info(f"Attributes to keep based on PyCG: {filtered_attributes}")
+            accessed = session.get("accessed", {}).get(module, [])
+            logger.info(f"Attributes to keep based on tracing: {accessed}")
+            filtered_attributes = list(dict.fromkeys(filtered_attributes + accessed))
 
             # Step 6.2 - Debloat the module
+            start = time.perf_counter()
             module_path, delta_record = debloat(
                 config=self.config,
                 module=module,
@@ -158,9 +533,78 @@ class Debloater:
             self.stats.set_path(module, module_path)
             self.stats.set_debloating_stats(module, delta_record)
 
-            # Re-import to update alive_modules
-            new_report = run_profiler(imported_modules)
-            update_alive_modules(alive_modules, new_report)
+            # Step 6.3 - Update alive_modules. In recursive mode, a module is
+            # alive as long as the test cases still load it. Otherwise, only
+            # the debloated module and what it imports are profiled again,
+            # and the import graph and the ranking are updated from them
+            previously_alive = set(alive_modules)
+            saving = "exclusive_time" if self.dominators else "self_time"
+            if self.recursive:
+                update_alive_modules(alive_modules, run_tracer(self.config))
+            else:
+                # A single run that records the import graph too, with the
+                # memory tracking of the rest of the report
+                try:
+                    subtree = run_profiler(
+                        [module], trace=self.memory == "tracemalloc", graph=True
+                    )
+                except Exception as e:
+                    logger.warning(f"Profiling {module} again failed: {e}")
+                    cmd_message(
+                        f"Profiling {module} again failed, its costs are not updated",
+                        "warning",
+                    )
+                    subtree = {}
+                subtree.pop("total_memory", None)
+                before = session["report"][module][saving]
+
+                graph.update(import_graph(subtree))
+                update_alive_modules(alive_modules, reachable(profiled_modules, graph))
+                session["ranking"] = rescore(
+                    session["ranking"],
+                    subtree,
+                    self.scoring,
+                    *session["totals"],
+                    full_report=session["report"],
+                    graph=graph,
+                    roots=profiled_modules,
+                    exclusive=self.dominators,
+                )
+
+                after = session["report"][module][saving]
+                yields = session.setdefault("yields", {})
+                yields[module] = realized_yield(before, after)
+                logger.info(f"Debloating {module} achieved {yields[module]:.1%}")
+
+                if scheduler is not None:
+                    scheduler.record(
+                        module, entry, time.perf_counter() - start, before, after
+                    )
+                    session["scheduler"] = scheduler.state()
+
+                # Rank again with the yield of this module, for the scoring
+                # functions that use it
+                if scheduler is not None:
+                    expected_yield = scheduler.expected_yield()
+                else:
+                    expected_yield = sum(yields.values()) / len(yields)
+                session["ranking"] = sort_report(
+                    dict(session["ranking"]),
+                    self.scoring,
+                    *session["totals"],
+                    self.dominators,
+                    graph,
+                    expected_yield,
+                )
+
+            dropped = previously_alive - alive_modules
+            if dropped:
+                logger.info(f"Modules no longer imported: {sorted(dropped)}")
+                cmd_message(f"{len(dropped)} modules are no longer imported")
+
+            session["alive_modules"] = sorted(alive_modules)
+            session["done"].append(module)
+            self.checkpoint(session)
 
         # --------------------------------------------------------------------- #
         # ---------------------- Stats-collecting Phase ----------------------- #
@@ -169,15 +613,24 @@ class Debloater:
         # Step 7 - Collect statistics
 
         # Step 7.1 - Run profiler
-        final_report = run_profiler(imported_modules)
+        final_report = profile_imports(profiled_modules, self.memory, self.profile_runs)
         logger.info("Final report after debloating:")
         logger.info(pp(final_report))
+        self.compare_profiles(final_report)
 
-        # Step 7.2 - Get statistics for alive modules
-        for module in alive_modules:
+        # Step 7.2 - Get statistics for the debloated modules
+        for module in session["done"]:
+            if module not in final_report:
+                continue
             entry = final_report[module]
             self.stats.set_profiling_stats(
-                module=module, memory=entry["memory"], time=entry["time"], before=True
+                module=module,
+                memory=entry["memory"],
+                time=entry["time"],
+                before=True,
+                native=entry.get("native", 0),
+                time_variance=entry.get("time_variance", 0),
+                memory_variance=entry.get("memory_variance", 0),
             )
 
         # Step 7.3 - Convert to CSV
@@ -190,3 +643,7 @@ class Debloater:
         cmd_message("Debloating process completed successfully!", "success")
 
         cmd_message("For detailed statistics, check log/ directory")
+        cmd_message(
+            f"For the import profiles before and after debloating, check "
+            f"{PROFILE_DIR}/ (Chrome traces, flamegraph stacks and diff.txt)"
+        )
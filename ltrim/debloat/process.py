@@ -1,13 +1,15 @@
 import importlib
+import os
+import time
 
 from pycgl import formats
 from pycgl.pycg import CallGraphGenerator
 from pycgl.utils.constants import CALL_GRAPH_OP
 
-from ltrim.debloat.utils import isolate
-from ltrim.delta import DeltaDebugger
+from ltrim.debloat.utils import combine_reports, isolate
+from ltrim.delta import DeltaDebugger, PyLambdaRunner
 from ltrim.profiler import get_memory_usage, profiler
-from ltrim.utils import Config
+from ltrim.utils import Config, cmd_message
 
 
 @isolate
@@ -26,13 +28,16 @@ def run_pycg(target):
 
 
 @isolate
-def run_profiler(modules):
+def run_profiler(modules, trace=False, graph=False):
     """
     Profile the import process of a list of modules.
 
     :param modules: A list of modules to profile
+    :param trace: Measure memory with tracemalloc instead of the resident
+        set size, and record the native mappings of every module
+    :param graph: Record the modules that every module imports
     """
-    profiler.attach()
+    profiler.attach(trace, graph)
 
     starting_memory = get_memory_usage()
 
@@ -42,13 +47,123 @@ def run_profiler(modules):
     ending_memory = get_memory_usage()
 
     profiler_report = profiler.get_report()
-    profiler_report["total_memory"] = ending_memory - starting_memory
+    if trace:
+        total_memory = sum(
+            entry["memory"]
+            for entry in profiler_report.values()
+            if entry["parent"] is None
+        )
+    else:
+        total_memory = ending_memory - starting_memory
+    profiler_report["total_memory"] = total_memory
 
     profiler.detach()
 
     return profiler_report
 
 
+def profile_imports(modules, memory="rss", runs=1, graph=False):
+    """
+    Profile the import process of a list of modules. With more than one run,
+    the runs are isolated processes that run in parallel, and the report holds
+    the medians of the measures, their confidence intervals and variances.
+    With tracemalloc, the memory comes from one more run with tracing, which
+    is deterministic but slows down the imports.
+
+    :param modules: A list of modules to profile
+    :param memory: How to measure memory, "rss" or "tracemalloc"
+    :param runs: The number of profiling runs
+    :param graph: Add the modules that every module imports to the report,
+        from the tracemalloc run or from one more run, so that recording
+        them does not slow down the timed runs
+    """
+    if runs > 1:
+        reports = []
+        parallel = max(1, min(runs, os.cpu_count() or 1))
+        for start in range(0, runs, parallel):
+            pending = [
+                run_profiler.spawn(modules)
+                for _ in range(start, min(runs, start + parallel))
+            ]
+            reports.extend(result() for result in pending)
+        report = combine_reports(reports)
+    else:
+        report = run_profiler(modules)
+
+    if memory == "tracemalloc":
+        traced = run_profiler(modules, trace=True, graph=graph)
+        report["total_memory"] = traced.pop("total_memory")
+
+        for module, entry in traced.items():
+            if module not in report:
+                continue
+            if graph:
+                report[module]["imports"] = entry["imports"]
+            for key in ("memory", "self_memory", "native", "self_native"):
+                report[module][key] = entry[key]
+            if runs > 1:
+                report[module]["memory_ci"] = (entry["memory"], entry["memory"])
+                report[module]["self_memory_ci"] = (
+                    entry["self_memory"],
+                    entry["self_memory"],
+                )
+                report[module]["memory_variance"] = 0.0
+    elif graph:
+        recorded = run_profiler(modules, graph=True)
+        for module, entry in report.items():
+            if module in recorded and isinstance(entry, dict):
+                entry["imports"] = recorded[module]["imports"]
+
+    return report
+
+
+def run_tracer(config: Config):
+    """
+    Run the test cases of the application once and return the modules that
+    it loads, including the ones that only the handler imports, in the order
+    in which their imports start.
+
+    :param config: The configuration of the application
+    """
+    events = PyLambdaRunner(config=config).trace_imports()
+    return [name for kind, name, _ in events if kind == "start"]
+
+
+def run_attribute_tracer(config: Config):
+    """
+    Run the test cases of the application once and return the module-level
+    attributes that the handler and the application read from every module,
+    which debloating has to keep. If the test cases fail, no attributes are
+    returned.
+
+    :param config: The configuration of the application
+    """
+    accessed, status = PyLambdaRunner(config=config).trace_attributes()
+    if accessed is None:
+        cmd_message(
+            "Tracing the attributes failed "
+            f"({status.get('reason', 'no status')}), Delta Debugging decides "
+            "on every attribute",
+            "warning",
+        )
+        return {}
+    return accessed
+
+
+def oracle_latency(config: Config):
+    """
+    Run the test cases of the application once and return the wall time, in
+    seconds, as an estimate of the latency of an oracle check
+
+    :param config: The configuration of the application
+    """
+    runner = PyLambdaRunner(config=config)
+
+    start = time.perf_counter()
+    runner.run()
+    return time.perf_counter() - start
+
+
 @isolate
 def debloat(config: Config, module, marked_attributes):
     """
@@ -63,6 +178,10 @@ def debloat(config: Config, module, marked_attributes):
 
     debloated_attributes, delta_record = delta_debugger.delta_debug(log=True)
 
-    module_path = delta_debugger.finalize_module(debloated_attributes)
+    lazy = []
+    if config.lazy_imports:
+        lazy = delta_debugger.lazy_imports(debloated_attributes)
+
+    module_path = delta_debugger.finalize_module(debloated_attributes, lazy=lazy)
 
     return module_path, delta_record
@@ -0,0 +1,282 @@
+import ast
+import math
+
+from ltrim.transformers import DefinitionsFinder
+
+# Prior of the fraction of the expected savings that debloating a module
+# achieves, counted as one observation until modules are debloated
+PRIOR_YIELD = 0.5
+
+
+def count_attributes(path):
+    """
+    Count the module-level names of a Python module, i.e. the attributes that
+    Delta Debugging decides on
+
+    :param path: The path of the module
+    :return: The number of names, or None if the module has no Python source
+    """
+    if not path or not path.endswith(".py"):
+        return None
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            module_ast = ast.parse(f.read())
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return None
+
+    finder = DefinitionsFinder()
+    finder.visit(module_ast)
+    return max(1, len(finder.references))
+
+
+def import_cost(report, modules):
+    """
+    The total self import time and memory of a set of modules
+
+    :param report: The profiling report
+    :param modules: The modules
+    :return: The import time in milliseconds and the memory in MB
+    """
+    entries = [report[module] for module in modules if module in report]
+    return (
+        sum(entry["self_time"] for entry in entries),
+        sum(entry["self_memory"] for entry in entries),
+    )
+
+
+def realized_yield(before, after):
+    """
+    The fraction of the expected saving of a module that debloating it
+    achieved, between 0 and 1
+
+    :param before: The expected saving, e.g. the exclusive import time of the
+        module, before debloating
+    :param after: The same measure after debloating
+    """
+    if before <= 0:
+        return 0.0
+    return min(1.0, max(0.0, (before - after) / before))
+
+
+def knapsack(items, capacity, resolution=256):
+    """
+    Choose the items with the highest total gain whose total cost fits in a
+    capacity, with dynamic programming over the capacity split in units
+
+    :param items: The (name, gain, cost) of every item
+    :param capacity: The capacity
+    :param resolution: The number of units of the capacity
+    :return: The names of the chosen items
+    """
+    if capacity <= 0:
+        return []
+
+    unit = capacity / resolution
+    weights = [max(1, math.ceil(cost / unit)) for _, _, cost in items]
+
+    # best[w] is the highest gain of the items so far within w units
+    best = [0.0] * (resolution + 1)
+    chosen = [[False] * (resolution + 1) for _ in items]
+
+    for i, (_, gain, _) in enumerate(items):
+        for w in range(resolution, weights[i] - 1, -1):
+            if best[w - weights[i]] + gain > best[w]:
+                best[w] = best[w - weights[i]] + gain
+                chosen[i][w] = True
+
+    names, w = [], resolution
+    for i in range(len(items) - 1, -1, -1):
+        if chosen[i][w]:
+            names.append(items[i][0])
+            w -= weights[i]
+
+    return names[::-1]
+
+
+class Scheduler:
+    """
+    Pick and order the modules to debloat under a wall-clock budget, or until
+    a target of import time or memory savings is reached, instead of a fixed
+    number of modules.
+
+    The cost of debloating a module is estimated as its number of attributes
+    times the latency of an oracle check, corrected by how long the modules
+    that are already debloated took compared with their estimates. The
+    expected gain of a module is its score times the fraction of the expected
+    savings that debloating the modules so far achieved.
+
+    :param latency: The latency of an oracle check, in seconds
+    :param budget: The wall-clock budget, in seconds, or None
+    :param target_time: The fraction of the import time to save, or None
+    :param target_memory: The fraction of the import memory to save, or None
+    :param state: The state of an interrupted run, see state
+    """
+
+    def __init__(
+        self, latency, budget=None, target_time=None, target_memory=None, state=None
+    ):
+        self.latency = latency
+        self.budget = budget
+        self.target_time = target_time
+        self.target_memory = target_memory
+
+        state = state or {}
+        self.elapsed = state.get("elapsed", 0.0)
+        self.history = state.get("history", [])
+        self.sizes = {}
+
+    def state(self):
+        """
+        JSON-serializable state of the scheduler, for checkpoints
+        """
+        return {"elapsed": self.elapsed, "history": self.history}
+
+    def calibration(self):
+        """
+        Ratio of the actual to the estimated debloating time of the modules
+        that are already debloated, 1 if there are none
+        """
+        estimated = sum(record["estimate"] for record in self.history)
+        if estimated <= 0:
+            return 1.0
+        return sum(record["seconds"] for record in self.history) / estimated
+
+    def expected_yield(self):
+        """
+        Mean fraction of the expected savings that debloating achieved, with
+        PRIOR_YIELD as a first observation
+        """
+        yields = [PRIOR_YIELD] + [record["yield"] for record in self.history]
+        return sum(yields) / len(yields)
+
+    def naive_estimate(self, entry):
+        """
+        Uncalibrated estimate of the debloating time of a module, in seconds,
+        or None if the module cannot be debloated
+
+        :param entry: The report entry of the module
+        """
+        path = entry.get("path")
+        if path not in self.sizes:
+            self.sizes[path] = count_attributes(path)
+
+        if self.sizes[path] is None:
+            return None
+        return self.sizes[path] * self.latency
+
+    def estimate(self, entry):
+        """
+        Estimate the debloating time of a module, in seconds
+
+        :param entry: The report entry of the module
+        """
+        naive = self.naive_estimate(entry)
+        return None if naive is None else naive * self.calibration()
+
+    def plan(self, ranking, done, alive_modules):
+        """
+        Order the modules to debloat next. With a budget, only the modules
+        with the highest total expected gain that fit in the rest of the
+        budget are planned. The planned modules are ordered by their expected
+        gain per second, so that estimation errors cost the least.
+
+        :param ranking: The ranked modules and their report entries
+        :param done: The modules that are already debloated
+        :param alive_modules: The modules that the application still imports
+        :return: The planned (module, expected gain, estimated seconds)
+        """
+        expected_yield = self.expected_yield()
+
+        candidates = []
+        for module, entry in ranking:
+            if module in done or module not in alive_modules:
+                continue
+
+            cost = self.estimate(entry)
+            gain = max(entry["score"], 0) * expected_yield
+            if cost is not None and gain > 0:
+                candidates.append((module, gain, cost))
+
+        if self.budget is not None:
+            chosen = set(knapsack(candidates, self.budget - self.elapsed))
+            candidates = [c for c in candidates if c[0] in chosen]
+
+        return sorted(candidates, key=lambda c: c[1] / max(c[2], 1e-9), reverse=True)
+
+    def reached(self, initial, current):
+        """
+        Whether the targets are reached. Without targets, they never are.
+
+        :param initial: The (import time, memory) of the application before
+            debloating
+        :param current: The current (import time, memory)
+        """
+        targets = [
+            (target, before, now)
+            for target, before, now in zip(
+                (self.target_time, self.target_memory), initial, current, strict=True
+            )
+            if target is not None
+        ]
+        if not targets:
+            return False
+
+        return all(
+            before > 0 and (before - now) / before >= target
+            for target, before, now in targets
+        )
+
+    def record(self, module, entry, seconds, before, after):
+        """
+        Record the outcome of debloating a module
+
+        :param module: The debloated module
+        :param entry: The report entry of the module before debloating
+        :param seconds: The time that debloating took
+        :param before: The expected saving of the module, e.g. its exclusive
+            import time, before debloating
+        :param after: The same measure after debloating
+        """
+        self.elapsed += seconds
+        self.history.append(
+            {
+                "module": module,
+                "seconds": seconds,
+                "estimate": self.naive_estimate(entry) or 0.0,
+                "yield": realized_yield(before, after),
+            }
+        )
+
+    def progress(self, initial, current):
+        """
+        Describe the progress against the budget and the targets
+
+        :param initial: The (import time, memory) of the application before
+            debloating
+        :param current: The current (import time, memory)
+        """
+        parts = []
+        if self.budget is not None:
+            parts.append(
+                f"{self.elapsed / 60:.1f} of {self.budget / 60:.1f} minutes used"
+            )
+
+        (time_before, memory_before), (time_now, memory_now) = initial, current
+        time_saved = (time_before - time_now) / time_before if time_before else 0
+        memory_saved = (
+            (memory_before - memory_now) / memory_before if memory_before else 0
+        )
+
+        parts.append(
+            f"import time {time_before:.1f}ms -> {time_now:.1f}ms "
+            f"({time_saved:.1%} saved"
+            + (f", target {self.target_time:.0%})" if self.target_time else ")")
+        )
+        parts.append(
+            f"memory {memory_before:.2f}MB -> {memory_now:.2f}MB "
+            f"({memory_saved:.1%} saved"
+            + (f", target {self.target_memory:.0%})" if self.target_memory else ")")
+        )
+
+        return "Budget: " + ", ".join(parts)
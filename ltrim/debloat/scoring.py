@@ -0,0 +1,178 @@
+import importlib
+import math
+import random
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.metadata import entry_points
+
+from ltrim.utils import MS
+
+# Entry point group of the scoring plugins of other packages
+ENTRY_POINT_GROUP = "ltrim.scoring"
+
+
+@dataclass(frozen=True)
+class ModuleCost:
+    """
+    What a scoring function knows about a module. Times are in milliseconds
+    and memory in MB.
+
+    :param module: The name of the module
+    :param time: The import time that debloating the module can save, i.e.
+        its self time, or its exclusive time when modules are credited with
+        the modules that only they import
+    :param memory: The memory that debloating the module can save, likewise
+    :param self_time: The import time of the module without its imports
+    :param self_memory: The memory of the module without its imports
+    :param cumulative_time: The import time of the module with its imports
+    :param cumulative_memory: The memory of the module with its imports
+    :param total_time: The total import time of the application
+    :param total_memory: The total import memory of the application
+    :param depth: The number of imports that the first import of the module
+        is nested in, 0 for the imports of the application
+    :param importers: The number of modules that import the module
+    :param expected_yield: The mean fraction of the expected savings that
+        debloating the modules so far achieved, or None before any module
+        is debloated
+    """
+
+    module: str
+    time: float
+    memory: float
+    self_time: float
+    self_memory: float
+    cumulative_time: float
+    cumulative_memory: float
+    total_time: float
+    total_memory: float
+    depth: int = 0
+    importers: int = 0
+    expected_yield: float | None = None
+
+
+def cost_score(cost: ModuleCost):
+    """
+    The serverless cost model of the paper, which weighs the import time
+    and memory of a module by the memory and time of the rest of the imports
+    """
+    T, M = cost.total_time, cost.total_memory
+    return (T - cost.time) * cost.memory + cost.time * M
+
+
+def time_score(cost: ModuleCost):
+    return cost.time
+
+
+def memory_score(cost: ModuleCost):
+    return cost.memory
+
+
+def random_score(cost: ModuleCost):
+    return random.random()
+
+
+class GBSecondModel:
+    """
+    Cost model of serverless platforms that bill the duration of every
+    invocation in GB-seconds of the memory provisioned for the function,
+    where the memory is provisioned in tiers. The score of a module is the
+    price of a cold start that debloating it saves: the billed duration
+    shrinks by its import time, and the function can move to a smaller tier
+    if its memory no longer fits the current one.
+
+    :param price: The price of a GB-second, by default the price of AWS
+        Lambda on x86
+    :param tiers: The memory tiers that the function can be provisioned
+        with, in MB
+    :param base_memory: The memory of the runtime and of the application
+        besides its imports, in MB
+    :param invocation_time: The duration of the handler, in milliseconds,
+        which is billed at the provisioned tier too
+    """
+
+    def __init__(
+        self,
+        price=0.0000166667,
+        tiers=(128, 256, 512, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 10240),
+        base_memory=0.0,
+        invocation_time=0.0,
+    ):
+        self.price = price
+        self.tiers = sorted(tiers)
+        self.base_memory = base_memory
+        self.invocation_time = invocation_time
+
+    def tier(self, memory):
+        """
+        The smallest tier that fits an amount of memory, in MB
+
+        :param memory: The memory of the imports, in MB
+        """
+        needed = self.base_memory + memory
+        for tier in self.tiers:
+            if needed <= tier:
+                return tier
+        return self.tiers[-1]
+
+    def bill(self, time, memory):
+        """
+        The price of a cold start, with the duration rounded up to the
+        millisecond
+
+        :param time: The import time, in milliseconds
+        :param memory: The memory of the imports, in MB
+        """
+        duration = math.ceil(max(0.0, time + self.invocation_time)) * MS
+        return duration * self.tier(memory) / 1024 * self.price
+
+    def __call__(self, cost: ModuleCost):
+        before = self.bill(cost.total_time, cost.total_memory)
+        after = self.bill(cost.total_time - cost.time, cost.total_memory - cost.memory)
+        return before - after
+
+
+SCORING_METHODS = {
+    "cost": cost_score,
+    "time": time_score,
+    "memory": memory_score,
+    "random": random_score,
+    "gb-second": GBSecondModel(),
+}
+
+
+@lru_cache(maxsize=None)
+def load_scoring(method):
+    """
+    Find a scoring function, i.e. a callable that takes a ModuleCost and
+    returns the score of the module. A method is the name of a built-in
+    scoring function, the name of an entry point in the ltrim.scoring group,
+    or the path of a callable, as module:name or module.name.
+
+    :param method: The scoring method
+    :return: The scoring function
+    """
+    if method in SCORING_METHODS:
+        return SCORING_METHODS[method]
+
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name == method:
+            return entry_point.load()
+
+    if ":" in method:
+        module_name, _, name = method.partition(":")
+    else:
+        module_name, _, name = method.rpartition(".")
+
+    if module_name:
+        try:
+            function = getattr(importlib.import_module(module_name), name)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Cannot load the scoring method {method}: {e}") from e
+        if callable(function):
+            return function
+
+    raise ValueError(
+        f"Invalid scoring method {method}. Choose from "
+        f"{', '.join(repr(name) for name in SCORING_METHODS)}, an entry point "
+        f"of the {ENTRY_POINT_GROUP} group or the path of a function."
+    )
@@ -1,10 +1,14 @@
 # if python versionh is 3.11 or higher, use the sys.stdlib_module_names
-import random
-import re
+import math
+import statistics
 import sys
+from dataclasses import replace
 from functools import wraps
 from multiprocessing import Pipe, Process
 
+from ltrim.debloat.scoring import ModuleCost, load_scoring
+from ltrim.utils import immediate_dominators
+
 if sys.version_info >= (3, 11):
     blacklist = sys.stdlib_module_names
 else:
@@ -25,106 +29,463 @@ else:
 def isolate(func):
     """
     A decorator to run a function in a separate process and send its return value
-    through a pipe.
+    through a pipe. The decorated function also gets a spawn method that starts
+    the process and returns a function that waits for the return value, so that
+    several processes can run in parallel. An exception of the function is
+    raised again in the parent, and so is a RuntimeError if the process exits
+    without a result.
     """
 
-    @wraps(func)
-    def wrapper(*args, **kwargs):
+    def spawn(*args, **kwargs):
         # Create a pipe for communication
         parent_conn, child_conn = Pipe()
 
         def target(pipe_conn, *args, **kwargs):
-            # Call the wrapped function and send the result through the pipe
-            result = func(*args, **kwargs)
-            pipe_conn.send(result)
+            # Call the wrapped function and send the result, or the exception
+            # it raised, through the pipe
+            try:
+                message = (True, func(*args, **kwargs))
+            except Exception as e:
+                message = (False, e)
+            try:
+                pipe_conn.send(message)
+            except Exception:
+                # The result or the exception cannot be pickled
+                pipe_conn.send((False, RuntimeError(repr(message[1]))))
             pipe_conn.close()  # Close the pipe connection after sending the result
 
         # Run the function in a separate process, passing the child pipe connection
         process = Process(target=target, args=(child_conn, *args), kwargs=kwargs)
         process.start()
-        process.join()  # Wait for the process to complete
+        # Only the child holds its end now, so that the parent sees the pipe
+        # close if the child dies without sending anything
+        child_conn.close()
+
+        def result():
+            # Receive before joining, a large result does not fit in the pipe
+            # and the process only exits once it is received
+            try:
+                ok, value = parent_conn.recv()
+            except EOFError:
+                process.join()
+                raise RuntimeError(
+                    f"{func.__name__} exited with code {process.exitcode} "
+                    "without a result"
+                ) from None
+            finally:
+                parent_conn.close()
+            process.join()  # Wait for the process to complete
+            if not ok:
+                raise value
+            return value
+
+        return result
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return spawn(*args, **kwargs)()
 
-        # Return the parent pipe connection for the caller to retrieve the result
-        return parent_conn.recv()
+    wrapper.spawn = spawn
 
     return wrapper
 
 
-def scoring(method, t, m, T, M):
+def scoring(method, cost: ModuleCost):
     """
     The scoring method to calculate the top K ranking of the modules.
 
-    :param method: The scoring method to use
-    :param t: The import time of the module
-    :param m: The memory usage of the module
+    :param method: The scoring method to use, see load_scoring
+    :param cost: What is known about the module
+    :return: The score of the module based on the scoring method
+    """
+    return load_scoring(method)(cost)
+
+
+def module_costs(report, T, M, exclusive=False, graph=None, expected_yield=None):
+    """
+    The costs of the modules of a profiling report, as scoring functions
+    see them
+
+    :param report: The profiling report
     :param T: The total import time of the application
     :param M: The total memory usage of the application
-    :return: The score of the module based on the scoring method
+    :param exclusive: Credit every module with its exclusive costs
+    :param graph: The import graph, to count the importers of every module
+    :param expected_yield: The mean fraction of the expected savings that
+        debloating achieved so far, if any module is debloated
+    :return: A dictionary from modules to their ModuleCost
     """
-    if method == "time":
-        return t
-    elif method == "memory":
-        return m
-    elif method == "cost":
-        return (T - t) * m + t * M
-    elif method == "random":
-        return random.random()
-    elif method == "custom":
-        pass  # Placeholder for custom scoring method
-    else:
-        raise ValueError(
-            "Invalid scoring method. Choose from 'time', 'memory', 'cost' or 'random'."
+    prefix = "exclusive" if exclusive else "self"
+
+    importers = {}
+    for imports in (graph or {}).values():
+        for imported in imports:
+            importers[imported] = importers.get(imported, 0) + 1
+
+    costs = {}
+    for module, entry in report.items():
+        depth, parent = 0, entry.get("parent")
+        while parent is not None and parent in report and depth < len(report):
+            depth += 1
+            parent = report[parent].get("parent")
+
+        costs[module] = ModuleCost(
+            module=module,
+            time=entry[prefix + "_time"],
+            memory=entry[prefix + "_memory"],
+            self_time=entry["self_time"],
+            self_memory=entry["self_memory"],
+            cumulative_time=entry["time"],
+            cumulative_memory=entry["memory"],
+            total_time=T,
+            total_memory=M,
+            depth=depth,
+            importers=importers.get(module, 0),
+            expected_yield=expected_yield,
         )
 
+    return costs
+
 
-def sort_report(report, method, T, M):
+def sort_report(report, method, T, M, exclusive=False, graph=None, expected_yield=None):
     """
-    Sort the profiling report based on the scoring method.
+    Sort the profiling report based on the scoring method. Modules are
+    scored by their self time and memory, i.e. by what debloating them can
+    save, so packages are not credited with the cost of the modules they
+    import. With exclusive set, modules are scored by their exclusive time
+    and memory instead, see exclusive_costs.
 
     :param report: The profiling report to sort
     :param method: The scoring method to use for sorting
+    :param exclusive: Score the modules by their exclusive costs
+    :param graph: The import graph, for the scoring functions
+    :param expected_yield: The mean fraction of the expected savings that
+        debloating achieved so far, for the scoring functions
     :return: The sorted list of modules based on the scoring method
     """
+    costs = module_costs(report, T, M, exclusive, graph, expected_yield)
 
     # Add scoring to the report
     for entry in report:
-        report[entry]["score"] = scoring(
-            method,
-            report[entry]["time"],
-            report[entry]["memory"],
-            T,
-            M,
-        )
+        report[entry]["score"] = scoring(method, costs[entry])
 
     # Step 4: Sort the modules based on the scoring method
     return sorted(report.items(), key=lambda x: x[1]["score"], reverse=True)
 
 
-def filter_pycg(module, pycg_attributes):
+def median_interval(samples, z=1.96):
     """
-    Filter the PyCG attributes by keeping only the ones that are in the module.
+    The median of a list of samples and a distribution-free confidence
+    interval for it, from the order statistics of the samples. The default
+    z gives a 95% interval.
 
-    :param module: The module to filter the attributes
-    :param pycg_attributes: The PyCG attributes to filter
-    :return: The filtered PyCG attributes
+    :param samples: The samples
+    :param z: The standard score of the confidence level
+    :return: The median and the (low, high) interval
+    """
+    ordered = sorted(samples)
+    n = len(ordered)
+
+    # 1-based ranks of the bounds of the interval
+    low = max(1, math.floor((n - z * math.sqrt(n)) / 2))
+    high = min(n, math.ceil((n + z * math.sqrt(n)) / 2) + 1)
+
+    return statistics.median(ordered), (ordered[low - 1], ordered[high - 1])
+
+
+def combine_reports(reports):
+    """
+    Combine the profiling reports of repeated runs. Every measure of a module
+    becomes the median of the runs, with its confidence interval under the
+    measure's name with a _ci suffix, and the variances of the import time
+    and memory are added as time_variance and memory_variance.
+
+    :param reports: The profiling reports
+    :return: The combined report
+    """
+    combined = {}
+
+    for module, entry in reports[0].items():
+        if module == "total_memory":
+            continue
+
+        samples = [report[module] for report in reports if module in report]
+        combined[module] = dict(entry)
+
+        for key in ("time", "self_time", "memory", "self_memory"):
+            values = [sample[key] for sample in samples]
+            median, interval = median_interval(values)
+            combined[module][key] = median
+            combined[module][key + "_ci"] = interval
+            if key in ("time", "memory"):
+                variance = statistics.variance(values) if len(values) > 1 else 0.0
+                combined[module][key + "_variance"] = variance
+
+    combined["total_memory"] = statistics.median(
+        report["total_memory"] for report in reports
+    )
+
+    return combined
+
+
+def exclusive_costs(report, graph, roots):
     """
+    Add the exclusive time and memory of every module to a profiling report,
+    i.e. the self costs of the modules that only it pulls in: the modules it
+    dominates in the import graph, starting from the imports of the
+    application, itself included. Debloating a module can save at most its
+    exclusive costs, since every other module is still imported some other
+    way. The confidence intervals of the costs, if any, are added up too.
+
+    :param report: The profiling report, updated in place
+    :param graph: The import graph, from every module to the modules it imports
+    :param roots: The modules that the application imports
+    """
+    edges = dict(graph)
+    # The application is the root of the graph
+    edges[None] = [module for module in roots if module in report]
+
+    idom, postorder = immediate_dominators(None, edges)
+
+    for entry in report.values():
+        for key in ("time", "memory"):
+            entry["exclusive_" + key] = entry["self_" + key]
+            if "self_" + key + "_ci" in entry:
+                entry["exclusive_" + key + "_ci"] = tuple(entry["self_" + key + "_ci"])
+
+    # Every module comes after the modules it dominates in postorder
+    for module in postorder:
+        dominator = idom[module]
+        if module is None or dominator is None or module not in report:
+            continue
+
+        entry, parent = report[module], report[dominator]
+        for key in ("time", "memory"):
+            parent["exclusive_" + key] += entry["exclusive_" + key]
+            if "exclusive_" + key + "_ci" in entry:
+                low, high = parent["exclusive_" + key + "_ci"]
+                low_child, high_child = entry["exclusive_" + key + "_ci"]
+                parent["exclusive_" + key + "_ci"] = (
+                    low + low_child,
+                    high + high_child,
+                )
+
+
+def unstable_modules(
+    sorted_report, method, k, T, M, exclusive=False, graph=None, report=None
+):
+    """
+    Find the modules whose place in or out of the top K of a ranking is
+    uncertain. A module is uncertain if the confidence interval of its score
+    overlaps with the interval of a module on the other side of the top K.
+    The bounds of a score are the scores of the bounds of the self time and
+    memory of the module.
+
+    :param sorted_report: The combined profiling report, sorted by score
+    :param method: The scoring method
+    :param k: The number of modules in the top K
+    :param T: The total import time of the application
+    :param M: The total memory usage of the application
+    :param exclusive: Whether the modules are scored by their exclusive costs
+    :param graph: The import graph that the modules were scored with
+    :param report: The profiling report that the modules were scored from,
+        if the sorted report leaves modules out, so that the scoring
+        functions see the same depth of every module
+    :return: The uncertain modules
+    """
+    prefix = "exclusive" if exclusive else "self"
+
+    if method == "random" or not 0 < k < len(sorted_report):
+        return []
+    if any(prefix + "_time_ci" not in entry for _, entry in sorted_report):
+        return []
+
+    if report is None:
+        report = dict(sorted_report)
+    costs = module_costs(report, T, M, exclusive, graph)
+
+    def bounds(module, entry):
+        (t_low, t_high), (m_low, m_high) = (
+            entry[prefix + "_time_ci"],
+            entry[prefix + "_memory_ci"],
+        )
+        return (
+            scoring(method, replace(costs[module], time=t_low, memory=m_low)),
+            scoring(method, replace(costs[module], time=t_high, memory=m_high)),
+        )
+
+    scores = {module: bounds(module, entry) for module, entry in sorted_report}
+    top = [module for module, _ in sorted_report[:k]]
+    rest = [module for module, _ in sorted_report[k:]]
+
+    best_rest = max(scores[module][1] for module in rest)
+    worst_top = min(scores[module][0] for module in top)
+
+    return [module for module in top if scores[module][0] < best_rest] + [
+        module for module in rest if scores[module][1] > worst_top
+    ]
+
+
+def package_of(module):
+    """
+    The top-level package of a module, e.g. "a" for "a.b.c"
+
+    :param module: The name of the module
+    """
+    return module.partition(".")[0]
+
+
+def expand_packages(sorted_report, loaded_modules, top_K):
+    """
+    Select the top K packages of a sorted profiling report and expand every
+    package to the modules of its tree that the application loads. Packages
+    are ranked by the best score of their modules, and only modules with a
+    Python source can be debloated.
+
+    :param sorted_report: The profiling report, sorted by score
+    :param loaded_modules: The modules that the application loads
+    :param top_K: The number of packages to select
+    :return: The modules of the selected packages and their report entries,
+        sorted by score
+    """
+    packages = []
+    for module, _ in sorted_report:
+        package = package_of(module)
+        if package not in packages:
+            packages.append(package)
+
+    packages = set(packages[:top_K])
+    loaded_modules = set(loaded_modules)
 
-    # using regex to match the module name, i.e. "module.*"
-    pattern = re.compile(r"{}.*".format(module))
     return [
-        attr.removeprefix(module + ".")
-        for attr in pycg_attributes
-        if pattern.match(attr)
+        (module, entry)
+        for module, entry in sorted_report
+        if package_of(module) in packages
+        and module in loaded_modules
+        and (entry.get("path") or "").endswith(".py")
     ]
 
 
+def import_graph(report):
+    """
+    The import graph of a profiling report, from every module to the modules
+    it imports. Entries without recorded imports fall back to the modules
+    that they loaded first.
+
+    :param report: The profiling report
+    :return: A dictionary from modules to the lists of modules they import
+    """
+    return {
+        module: list(entry.get("imports", entry["children"]))
+        for module, entry in report.items()
+        if isinstance(entry, dict)
+    }
+
+
+def rescore(
+    ranking,
+    report,
+    method,
+    T,
+    M,
+    full_report=None,
+    graph=None,
+    roots=None,
+    exclusive=False,
+    expected_yield=None,
+):
+    """
+    Update the measures of the modules of a ranking that a new profiling
+    report holds, and sort the ranking again. With exclusive set, the
+    exclusive costs of the modules are computed again over the full report.
+
+    :param ranking: The ranked modules and their report entries
+    :param report: The new profiling report
+    :param method: The scoring method
+    :param T: The total import time of the application
+    :param M: The total memory usage of the application
+    :param full_report: The profiling report of every module, updated in place
+    :param graph: The import graph
+    :param roots: The modules that the application imports
+    :param exclusive: Score the modules by their exclusive costs
+    :param expected_yield: The mean fraction of the expected savings that
+        debloating achieved so far, for the scoring functions
+    :return: The updated ranking
+    """
+    entries = {module: dict(entry) for module, entry in ranking}
+    if full_report is None:
+        full_report = entries
+
+    for module, entry in report.items():
+        if module in full_report:
+            for key in ("time", "memory", "self_time", "self_memory"):
+                full_report[module][key] = entry[key]
+            # Native memory is only recorded with tracemalloc
+            for key in ("native", "self_native"):
+                if key in entry:
+                    full_report[module][key] = entry[key]
+
+    if exclusive:
+        exclusive_costs(full_report, graph, roots)
+
+    entries = {module: full_report[module] for module in entries}
+    return sort_report(entries, method, T, M, exclusive, graph, expected_yield)
+
+
+def next_module(ranking, done, alive_modules, limit=None):
+    """
+    The best ranked module that is still alive and not debloated yet
+
+    :param ranking: The ranked modules and their report entries
+    :param done: The modules that are already debloated
+    :param alive_modules: The modules that the application still imports
+    :param limit: The number of modules to debloat, or None for all of them
+    :return: The module, or None if there is none or the limit is reached
+    """
+    if limit is not None and len(done) >= limit:
+        return None
+
+    for module, _ in ranking:
+        if module not in done and module in alive_modules:
+            return module
+
+    return None
+
+
+def index_pycg(pycg_attributes):
+    """
+    Index the PyCG attributes by every dotted prefix of their names, e.g.
+    a.b.c is indexed as b.c under a and as c under a.b
+
+    :param pycg_attributes: The PyCG attributes
+    :return: A dictionary from prefixes to the rest of the names
+    """
+    index = {}
+    for attr in pycg_attributes:
+        parts = attr.split(".")
+        for i in range(1, len(parts)):
+            index.setdefault(".".join(parts[:i]), []).append(".".join(parts[i:]))
+    return index
+
+
+def filter_pycg(module, pycg_index):
+    """
+    Filter the PyCG attributes by keeping only the ones that are in the module.
+
+    :param module: The module to filter the attributes
+    :param pycg_index: The prefix index of the PyCG attributes, see index_pycg
+    :return: The filtered PyCG attributes, without the module prefix
+    """
+    return list(pycg_index.get(module, []))
+
+
 def update_alive_modules(alive_modules, report):
     """
     Update the alive modules based on the report. Dictionaries are mutable objects,
     so the alive_modules set will be updated in place.
 
     :param alive_modules: The set of alive modules
-    :param report: The profiling report
+    :param report: The profiling report, or the modules that are still loaded
     """
     modules_to_remove = [module for module in alive_modules if module not in report]
     for module in modules_to_remove:
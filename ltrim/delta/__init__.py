@@ -1,16 +1,30 @@
 import argparse
+import os
 
+from ltrim.delta.artifacts import ArtifactStore, read_iteration
+from ltrim.delta.cache import OracleCache
 from ltrim.delta.delta import DeltaDebugger
+from ltrim.delta.strategies import STRATEGIES
 from ltrim.delta.utils import PyLambdaRunner
+from ltrim.utils import Config, cmd_message
 
-__all__ = ["DeltaDebugger", "PyLambdaRunner"]
+__all__ = [
+    "ArtifactStore",
+    "DeltaDebugger",
+    "OracleCache",
+    "PyLambdaRunner",
+    "STRATEGIES",
+    "read_iteration",
+]
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="""
         Run Delta Debugging on a module with a target program and a
-        set of attributes to keep.
+        set of attributes to keep. With more than one strategy, every
+        strategy runs on the original module and the number of oracle
+        calls of each one is reported.
         """
     )
     parser.add_argument("target", help="The target program")
@@ -21,17 +35,55 @@ def main():
         default="data.json",
         help="JSON file containing test cases.",
     )
+    parser.add_argument(
+        "--handler",
+        type=str,
+        default="handler",
+        help="The name of the function handler.",
+    )
+    parser.add_argument(
+        "--strategy",
+        type=str,
+        nargs="+",
+        default=["ddmin"],
+        choices=list(STRATEGIES),
+        help="The minimization strategies to run.",
+    )
     parser.add_argument("attributes", type=str, nargs="*", help="Attributes to keep.")
 
     args = parser.parse_args()
 
-    debugger = DeltaDebugger(
-        target=args.target,
-        module_name=args.module,
-        marked_attributes=args.attributes,
-        test_cases=args.test_cases,
-    )
+    os.makedirs("log", exist_ok=True)
+
+    results = []
+    for strategy in args.strategy:
+        config = Config(
+            appname=args.target,
+            handler=args.handler,
+            test_cases=args.test_cases,
+            strategy=strategy,
+        )
+
+        debugger = DeltaDebugger(
+            config=config,
+            module_name=args.module,
+            marked_attributes=args.attributes,
+        )
+
+        remaining_attributes, delta_record = debugger.delta_debug()
+        results.append((strategy, remaining_attributes, delta_record))
+
+        if strategy == args.strategy[-1]:
+            debugger.finalize_module(remaining_attributes)
+        else:
+            # The next strategy starts from the original module
+            debugger.moduifier.restore_original_directory()
 
-    remaining_attributes = debugger.delta_debug()
-    print(f"Remaining attributes: {remaining_attributes}")
-    debugger.finalize_module(remaining_attributes)
+    for strategy, remaining_attributes, delta_record in results:
+        debloat_time, _, attrs_after, oracle_calls = delta_record
+        cmd_message(
+            f"{strategy}: {oracle_calls} oracle calls, {attrs_after} attributes "
+            f"kept, {debloat_time:.2f}s",
+            "info",
+        )
+        print(f"Remaining attributes: {remaining_attributes}")
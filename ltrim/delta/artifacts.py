@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of the candidates that the oracle checks.
+
+    The store keeps the attribute table of the module in attributes.json,
+    and one line per check in index.jsonl, with the kept attributes as a
+    bitmap over the table and the hash of the candidate source. Every
+    distinct source is written once to objects/<hash>.py. The artifacts are
+    rendered and written by a background thread, so the oracle never waits
+    for them.
+
+    :param directory: The directory of the store
+    :param attributes: The attribute table of the module
+    :param render: Function that returns the source of the candidate that
+        keeps a list of attributes
+    """
+
+    def __init__(self, directory, attributes, render):
+        self.directory = directory
+        self.attributes = list(attributes)
+        self.position = {attr: i for i, attr in enumerate(self.attributes)}
+        self.render = render
+
+        os.makedirs(directory + "/objects", exist_ok=True)
+        with open(directory + "/attributes.json", "w", encoding="utf-8") as f:
+            json.dump(self.attributes, f)
+
+        self.index = open(directory + "/index.jsonl", "a", encoding="utf-8")
+
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+
+    def record(self, iteration, attributes):
+        """
+        Queue the artifacts of an oracle check
+
+        :param iteration: The number of the check
+        :param attributes: The attributes that the candidate keeps
+        """
+        self.queue.put((iteration, list(attributes)))
+
+    def bitmap(self, attributes):
+        """
+        Encode a set of attributes as a bitmap over the attribute table,
+        in hexadecimal
+
+        :param attributes: The attributes to encode
+        """
+        bits = 0
+        for attr in attributes:
+            bits |= 1 << self.position[attr]
+        return format(bits, "x")
+
+    def writer(self):
+        """
+        Write the queued artifacts until the store is closed
+        """
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+
+            iteration, attributes = entry
+
+            try:
+                source = self.render(attributes)
+            except Exception:
+                digest = None
+            else:
+                digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+                path = f"{self.directory}/objects/{digest}.py"
+                if not os.path.exists(path):
+                    with open(path + ".tmp", "w", encoding="utf-8") as f:
+                        f.write(source)
+                    os.replace(path + ".tmp", path)
+
+            self.index.write(
+                json.dumps(
+                    {
+                        "iteration": iteration,
+                        "keep": self.bitmap(attributes),
+                        "source": digest,
+                    }
+                )
+                + "\n"
+            )
+            self.index.flush()
+
+    def close(self):
+        """
+        Write the remaining artifacts and stop the writer thread
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.index.close()
+
+
+def read_iteration(directory, iteration):
+    """
+    Read the artifacts of an oracle check back from a store
+
+    :param directory: The directory of the store
+    :param iteration: The number of the check
+    :return: The attributes that the candidate kept and its source, or None
+        if the check is not in the store
+    """
+    with open(directory + "/attributes.json", "r", encoding="utf-8") as f:
+        table = json.load(f)
+
+    with open(directory + "/index.jsonl", "r", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["iteration"] != iteration:
+                continue
+
+            bits = int(entry["keep"], 16)
+            attributes = [attr for i, attr in enumerate(table) if bits >> i & 1]
+
+            source = None
+            if entry["source"] is not None:
+                with open(
+                    f"{directory}/objects/{entry['source']}.py", "r", encoding="utf-8"
+                ) as s:
+                    source = s.read()
+
+            return attributes, source
+
+    return None
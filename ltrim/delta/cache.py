@@ -0,0 +1,171 @@
+import hashlib
+import sys
+import threading
+
+# Reasons of failures that depend on the load of the machine rather than on
+# the kept attributes, see the limits of the driver
+LIMIT_REASONS = ("timeout", "memory")
+
+
+def file_digest(path):
+    """
+    Compute the SHA-256 digest of a file
+
+    :param path: The path to the file
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class OracleCache:
+    """
+    Cache of oracle results, keyed by the set of kept attributes.
+
+    An oracle result only holds for the same module source, test cases, marked
+    attributes and interpreter, so all of them are hashed into every key.
+    Failing sets are also kept as monotonicity hints: if keeping a set of
+    attributes fails, keeping any subset of it fails as well.
+
+    :param module_path: The path to the original source of the module
+    :param test_cases: The path to the test cases file
+    :param marked_attributes: Attributes that are always kept
+    """
+
+    def __init__(self, module_path, test_cases, marked_attributes=()):
+        context = hashlib.sha256()
+        context.update(file_digest(module_path).encode())
+        context.update(file_digest(test_cases).encode())
+        context.update(sys.executable.encode())
+        context.update(sys.version.encode())
+        for attr in sorted(set(marked_attributes)):
+            context.update(attr.encode() + b"\0")
+        self.context = context.hexdigest()
+
+        self.results = {}
+        # The reasons of the failures, by the keys of their results
+        self.reasons = {}
+        # Maximal failing sets, used to answer queries about their subsets
+        self.failing = []
+
+        self.hits = 0
+        self.implied = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+    def key(self, attributes):
+        """
+        Canonical hash of a set of kept attributes
+
+        :param attributes: The attributes under test
+        """
+        h = hashlib.sha256(self.context.encode())
+        for attr in sorted(set(attributes)):
+            h.update(attr.encode() + b"\0")
+        return h.hexdigest()
+
+    def lookup(self, attributes):
+        """
+        Return the known oracle result for a set of attributes, or None if
+        the oracle has to run.
+
+        :param attributes: The attributes under test
+        """
+        key = self.key(attributes)
+
+        with self.lock:
+            if key in self.results:
+                self.hits += 1
+                return self.results[key]
+
+            kept = frozenset(attributes)
+            if any(kept <= failing for failing in self.failing):
+                self.implied += 1
+                return False
+
+            self.misses += 1
+            return None
+
+    def record(self, attributes, result, reason=None):
+        """
+        Record the oracle result for a set of attributes. Runs that exceeded
+        a limit are not recorded, since another run of the same set of
+        attributes may pass, and neither are their subsets.
+
+        :param attributes: The attributes under test
+        :param result: The result of the oracle
+        :param reason: The reason of a failure, see the driver
+        """
+        if not result and reason in LIMIT_REASONS:
+            return
+
+        key = self.key(attributes)
+
+        with self.lock:
+            self.results[key] = result
+            if not result:
+                self.reasons[key] = reason
+
+            if not result:
+                kept = frozenset(attributes)
+                if not any(kept <= failing for failing in self.failing):
+                    self.failing = [f for f in self.failing if not f <= kept]
+                    self.failing.append(kept)
+
+    def state(self):
+        """
+        JSON-serializable state of the cache, for checkpoints
+        """
+        with self.lock:
+            return {
+                "context": self.context,
+                "results": dict(self.results),
+                "reasons": dict(self.reasons),
+                "failing": [sorted(failing) for failing in self.failing],
+            }
+
+    def restore(self, state):
+        """
+        Restore the results of a checkpoint. Results recorded for another
+        module source, test cases or interpreter are ignored, and so are
+        checkpoints without the reasons of the failures, which may hold runs
+        that failed on a limit. Such runs are never restored.
+
+        :param state: The state of the cache
+        :return: Whether the results were restored
+        """
+        if state.get("context") != self.context or "reasons" not in state:
+            return False
+
+        reasons = state["reasons"]
+        with self.lock:
+            self.results.update(
+                (key, result)
+                for key, result in state["results"].items()
+                if reasons.get(key) not in LIMIT_REASONS
+            )
+            self.reasons.update(
+                (key, reason)
+                for key, reason in reasons.items()
+                if reason not in LIMIT_REASONS
+            )
+            self.failing = [frozenset(failing) for failing in state["failing"]]
+        return True
+
+    def hit_rate(self):
+        """
+        Fraction of the lookups that did not need to run the oracle
+        """
+        lookups = self.hits + self.implied + self.misses
+        if lookups == 0:
+            return 0.0
+        return (self.hits + self.implied) / lookups
+
+    def summary(self):
+        """
+        One-line summary of the cache statistics
+        """
+        return (
+            f"{self.hits} hits, {self.implied} implied by failing supersets, "
+            f"{self.misses} misses ({self.hit_rate() * 100:.2f}% hit rate)"
+        )
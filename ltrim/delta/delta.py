@@ -1,12 +1,37 @@
-import ast
 import importlib
 import logging
+import marshal
+import os
+import py_compile
+import queue
 import sys
+import threading
 import time
-
-from ltrim.delta.utils import Found, PyLambdaRunner, chunks, flatten
+from concurrent.futures import ThreadPoolExecutor
+
+from ltrim.delta.artifacts import ArtifactStore
+from ltrim.delta.cache import OracleCache
+from ltrim.delta.strategies import STRATEGIES
+from ltrim.delta.utils import (
+    PyLambdaRunner,
+    attribute_units,
+    covered_time,
+    driver_status,
+    flatten,
+    startup_imports,
+)
 from ltrim.moduify import Moduify
-from ltrim.utils import MAGIC_ATTRIBUTES, Config, DeltaRecord, cmd_message, mkdirp
+from ltrim.utils import (
+    MAGIC_ATTRIBUTES,
+    MS,
+    Config,
+    DeltaRecord,
+    cmd_message,
+    load_checkpoint,
+    mkdirp,
+    reachable,
+    save_checkpoint,
+)
 
 
 class DeltaDebugger:
@@ -34,105 +59,353 @@ class DeltaDebugger:
         self.moduifier = Moduify(
             module_name=self.module_name,
             marked_attributes=self.marked_attrs,
+            resume=config.resume,
         )
 
         # Initialize the logger for the module under DD
         self.logger = logging.getLogger(module_name + "_delta")
         self.logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(f"log/{module_name}_delta.log")
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
+        if not self.logger.handlers:
+            handler = logging.FileHandler(f"log/{module_name}_delta.log")
+            handler.setLevel(logging.INFO)
+            formatter = logging.Formatter(
+                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+            )
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
         self.logger.propagate = False
 
         self.iterations = 0
-
-        # Create a logging directory for intermediate results
-        mkdirp("log/" + self.module_name + "/iterations")
+        # Oracle calls whose candidate did not compile
+        self.compile_errors = 0
+        self.lock = threading.Lock()
+
+        # Units of attributes that DD keeps or removes together, and the
+        # attributes that every attribute references
+        self.group_attributes = config.group_attributes
+        self.units = []
+        self.dependencies = {}
+        # Every attribute of the units, and the marked attributes together
+        # with the attributes they depend on, which DD does not decide on
+        self.attributes = []
+        self.fixed = []
+        # The module that every imported attribute comes from
+        self.sources = {}
+
+        # The minimization strategy
+        self.strategy = config.strategy
+
+        # Store of the candidates that the oracle checks
+        self.artifacts = None
+
+        # The state of the search is checkpointed after every round, so that
+        # an interrupted run can resume it
+        self.checkpoint_name = "delta_" + self.module_name
+        self.start_time = None
+        self.resumed_time = 0.0
+
+        # Create a logging directory for intermediate results, keeping the
+        # results of an interrupted run
+        if config.resume:
+            os.makedirs("log/" + self.module_name + "/iterations", exist_ok=True)
+        else:
+            mkdirp("log/" + self.module_name + "/iterations")
+
+        # In memory, every candidate is compiled here and the driver gets the
+        # marshalled code object, so no module file is written until the
+        # module is finalized
+        self.in_memory = config.in_memory and self.moduifier.is_python_module()
+        if self.in_memory:
+            mkdirp(self.moduifier.backup_dir + "/code")
+
+        # With more than one job, every worker writes its candidates to its
+        # own copy of the module, so the installed module is never touched
+        self.jobs = max(1, config.jobs)
+        self.executor = None
+        self.slots = queue.SimpleQueue()
+        for slot in range(self.jobs):
+            self.slots.put(slot)
+            if self.jobs > 1 and not self.in_memory:
+                mkdirp(self.worker_dir(slot))
+
+        # Oracle results that are already known
+        self.cache = OracleCache(
+            module_path=self.moduifier.backup_dir + "/" + self.moduifier.basename,
+            test_cases=config.test_cases,
+            marked_attributes=self.marked_attrs,
+        )
 
         # Instace of driver for running the target program
         self.runner = PyLambdaRunner(config=self.config)
 
+        start = time.perf_counter()
         process = self.runner.run()
+        elapsed = time.perf_counter() - start
 
         if process.returncode == 0:
             self.original_output = str(process.stdout, "utf-8")
             self.logger.info("Original output: %s", self.original_output)
+
+            # Compare the following runs against this one test case by test
+            # case, stopping at the first difference, and stop the runs that
+            # exceed the limits derived from this one
+            self.runner.expect(process, elapsed)
+            self.logger.info(
+                "Oracle limits: timeout %s s, address space %s bytes",
+                self.runner.timeout,
+                self.runner.max_memory,
+            )
         else:
             self.logger.error(f"Error running target program: {process.stderr}")
             sys.exit(1)
 
-    def oracle(self, attributes, log=True):
+        # Run the oracle checks in children forked from pre-warmed servers
+        if config.fork_server:
+            self.runner.serve(self.module_name)
+            self.logger.info("Fork server pre-imports: %s", self.runner.preload)
+
+    def worker_dir(self, slot):
+        """
+        Directory that holds the candidate module of a worker
+
+        :param slot: The slot of the worker
+        """
+        return self.moduifier.backup_dir + "/workers/w" + str(slot)
+
+    def oracle(self, attributes, log=True, slot=None):
         """
         Run the target program with the modified module and attributes.
         If the program fails to run, the oracle returns False.
-        Otherwise, it compares the output of the program with the
-        original output.
+        Otherwise, it compares the output of every test case with the
+        original output. Known results are answered from the cache.
 
         :param attributes: The attributes under test
+        :param slot: The worker slot to use. If None, the installed module
+            is modified in place
         """
 
-        self.iterations += 1
+        result = self.cache.lookup(attributes)
+        if result is not None:
+            self.logger.info("Cached oracle result: %s", result)
+            return result
 
-        if log:
-            try:
-                modified_ast = self.moduifier.modify(attributes, remove=False)
+        result, reason = self.run_oracle(attributes, log, slot)
+        self.cache.record(attributes, result, reason)
 
-                iteration_dir = (
-                    "log/" + self.module_name + "/iterations/i" + str(self.iterations)
-                )
-                mkdirp(iteration_dir)
+        return result
 
-                with open(
-                    iteration_dir + "/__init__.py", "w", encoding="utf-8"
-                ) as file:
-                    new_source = ast.unparse(modified_ast)
-                    file.write(new_source)
+    def run_oracle(self, attributes, log=True, slot=None):
+        """
+        Run the target program with the modified module and attributes
 
-                with open(iteration_dir + "/attr.txt", "w", encoding="utf-8") as file:
-                    file.write("Keeping the following attributes:\n")
-                    for item in attributes:
-                        file.write(f"{item}\n")
+        :param attributes: The attributes under test
+        :param slot: The worker slot to use
+        :return: Whether the run passed, and the reason if it failed
+        """
 
-            except Exception as e:
-                self.logger.error("Error modifying module: %s", e)
-                cmd_message(f"Error modifying module: {e}", "error")
+        with self.lock:
+            self.iterations += 1
+            iteration = self.iterations
 
-                return False
+        overrides = None
 
-        process = self.runner.run()
+        try:
+            if self.in_memory:
+                code = self.moduifier.snapshot.compile(
+                    attributes, self.moduifier.module_path
+                )
+                code_path = f"{self.moduifier.backup_dir}/code/w{slot or 0}.marshal"
+                with open(code_path, "wb") as file:
+                    marshal.dump(code, file)
+                overrides = {self.module_name: {"code": code_path}}
+            elif slot is None:
+                self.moduifier.modify(attributes, remove=False)
+            else:
+                candidate = self.worker_dir(slot) + "/" + self.moduifier.basename
+                self.moduifier.modify(attributes, remove=False, path=candidate)
+                overrides = {self.module_name: candidate}
+
+        except (py_compile.PyCompileError, SyntaxError) as e:
+            message = e.msg if isinstance(e, py_compile.PyCompileError) else e
+            self.logger.error("Candidate does not compile: %s", message)
+            with self.lock:
+                self.compile_errors += 1
+            return False, "compile"
+
+        except Exception as e:
+            self.logger.error("Error modifying module: %s", e)
+            cmd_message(f"Error modifying module: {e}", "error")
+
+            return False, "exception"
+
+        # The candidate is rendered again and stored in the background
+        if log and self.artifacts is not None:
+            self.artifacts.record(iteration, attributes)
+
+        process = self.runner.run(overrides=overrides, slot=slot or 0)
 
         if process.returncode == 0:
-            output = str(process.stdout, "utf-8")
+            return True, None
+
+        status = driver_status(process)
+        if status.get("reason") == "mismatch":
+            self.logger.info("Output of test case %s changed", status["failed"])
+        elif status.get("reason") in ("timeout", "memory"):
+            self.logger.warning(
+                "Run exceeded the %s limit at test case %s",
+                status["reason"],
+                status["failed"],
+            )
+        else:
+            self.logger.error("Error running target program: %s", process.stderr)
+        return False, status.get("reason", "exception")
 
-            if output != self.original_output:
-                self.logger.info("Output changed: %s", output)
-                self.logger.info("Original output: %s", self.original_output)
-                return False
+    def pooled_oracle(self, attributes, log=True):
+        """
+        Run the oracle on the first free worker slot
 
-            return output == self.original_output
+        :param attributes: The attributes under test
+        """
+        slot = self.slots.get()
+        try:
+            return self.oracle(attributes, log, slot=slot)
+        finally:
+            self.slots.put(slot)
 
-        else:
-            self.logger.error("Error running target program: %s", process.stderr)
-            return False
+    def first_passing(self, candidates, log=True, kind="partition"):
+        """
+        Return the index of the first candidate that passes the oracle,
+        or None if all of them fail. With more than one job, the candidates
+        are checked concurrently, but the earliest passing candidate is
+        returned, so the result is the same as in a serial run.
+
+        :param candidates: The list of attribute sets to check
+        :param kind: The kind of the candidates, used for logging
+        """
+
+        if self.executor is None:
+            for i, attributes in enumerate(candidates):
+                self.logger.info("Trying %s %s", kind, attributes)
+                if self.oracle(attributes, log):
+                    return i
+            return None
+
+        futures = []
+        for attributes in candidates:
+            self.logger.info("Trying %s %s", kind, attributes)
+            futures.append(self.executor.submit(self.pooled_oracle, attributes, log))
+
+        try:
+            for i, future in enumerate(futures):
+                if future.result():
+                    return i
+            return None
+        finally:
+            # Candidates after the first passing one are not needed
+            for future in futures:
+                future.cancel()
+
+    def close(self, attributes):
+        """
+        Extend a list of attributes with every attribute that they depend on,
+        in the order of the units
+
+        :param attributes: The attributes to extend
+        """
+        names = reachable(attributes, self.dependencies)
+        return [attr for attr in self.attributes if attr in names]
+
+    def hierarchy(self, units):
+        """
+        Split units into the coarse groups of a hierarchical strategy: one
+        group for all the attributes imported from the same module, and one
+        for every class. Units that fit neither are left out.
+
+        :param units: The units to split
+        :return: The groups of unit indices, and the indices of the other units
+        """
+        kinds = dict(self.moduifier.snapshot.members)
+
+        groups, others = {}, []
+        for i, unit in enumerate(units):
+            imported = [attr for attr in unit if attr in self.sources]
+            if imported:
+                key = ("import", self.sources[imported[0]])
+            elif any(kinds.get(attr) == "class" for attr in unit):
+                key = ("class", unit[0])
+            else:
+                others.append(i)
+                continue
+            groups.setdefault(key, []).append(i)
+
+        return list(groups.values()), others
+
+    def checkpoint(self, state):
+        """
+        Checkpoint the state of the search, together with everything the
+        oracle has found so far
+
+        :param state: The state of the minimization strategy
+        """
+        save_checkpoint(
+            self.checkpoint_name,
+            {
+                "strategy": self.strategy,
+                "units": self.units,
+                "state": state,
+                "iterations": self.iterations,
+                "compile_errors": self.compile_errors,
+                "time": self.resumed_time + time.time() - self.start_time,
+                "cache": self.cache.state(),
+            },
+        )
+
+    def resume(self):
+        """
+        Restore the checkpoint of an interrupted search on the same units
+        with the same strategy, and return the state of the strategy, or None
+        if there is no such checkpoint
+        """
+        checkpoint = load_checkpoint(self.checkpoint_name)
+        if (
+            checkpoint is None
+            or checkpoint["strategy"] != self.strategy
+            or checkpoint["units"] != self.units
+        ):
+            return None
+
+        if not self.cache.restore(checkpoint["cache"]):
+            self.logger.info("Oracle cache of the checkpoint is outdated")
+
+        self.iterations = checkpoint["iterations"]
+        self.compile_errors = checkpoint.get("compile_errors", 0)
+        self.resumed_time = checkpoint["time"]
+
+        self.logger.info("Resuming after %s oracle calls", self.iterations)
+        cmd_message(
+            f"Resuming Delta Debugging for module {self.module_name} "
+            f"after {self.iterations} oracle calls",
+            "info",
+        )
+        return checkpoint["state"]
 
     def delta_debug(self, log=False):
         """
         Delta-Debugging algorithm
         """
 
-        start = time.time()
+        start = self.start_time = time.time()
 
         if self.moduifier.ast is None:
             cmd_message("Module is not a Python file")
-            return [], DeltaRecord((0, 0, 0))
+            return [], DeltaRecord((0, 0, 0, 0))
 
-        cmd_message("Running Delta Debugging for module " + self.module_name)
+        cmd_message(
+            f"Running Delta Debugging ({self.strategy}) for module {self.module_name}"
+        )
 
         self.logger.info("Running DeltaDebugging for module %s", self.module_name)
+        self.logger.info("Strategy: %s", self.strategy)
         self.logger.info("Necessary attributes: %s", self.marked_attrs)
 
         module = importlib.import_module(self.module_name)
@@ -140,59 +413,200 @@ class DeltaDebugger:
         members = [x for x in dir(module) if x not in MAGIC_ATTRIBUTES]
         self.logger.info("Module attributes: %s", members)
 
-        remaining_attrs, n = members, 2
+        # Attributes that reference each other are kept or removed together
+        units, dependencies, self.sources = attribute_units(self.moduifier.ast, members)
+        if self.group_attributes:
+            self.units, self.dependencies = units, dependencies
+        else:
+            self.units, self.dependencies = [[member] for member in members], {}
+        self.attributes = flatten(self.units)
+
+        # The marked attributes and what they depend on are kept in any case,
+        # so the search only decides on the other units
+        self.fixed = self.close([attr for attr in self.marked_attrs if attr in members])
+        fixed = set(self.fixed)
+        self.units = [unit for unit in self.units if not fixed.issuperset(unit)]
+        self.logger.info("Fixed attributes: %s", self.fixed)
+        self.logger.info("Attribute units: %s", self.units)
+        cmd_message(
+            f"Grouped {len(members)} attributes into {len(self.units)} units"
+            + (f", {len(self.fixed)} attributes kept" if self.fixed else "")
+        )
 
         all_attributes = len(dir(module))
-        attrs_before = len(remaining_attrs)
-
-        while n <= len(remaining_attrs):
-            us = list(chunks(remaining_attrs, n))
-
-            try:
-                for i in range(n):
-                    attributes = us[i]
+        attrs_before = len(members)
 
-                    self.logger.info("Trying partition %s", attributes)
+        if self.jobs > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.jobs)
 
-                    if self.oracle(attributes, log):
-                        remaining_attrs, n = attributes, 2
-                        raise Found
-
-                if n > 2:
-                    for i in range(n):
-                        coattributes = us.copy()
-                        coattributes.pop(i)
-                        coattributes = flatten(coattributes)
-
-                        self.logger.info("Trying c-partition %s", coattributes)
+        if log:
+            self.artifacts = ArtifactStore(
+                directory="log/" + self.module_name + "/iterations",
+                attributes=self.attributes,
+                render=self.moduifier.snapshot.render,
+            )
+
+        state = self.resume() if self.config.resume else None
+
+        minimizer = STRATEGIES[self.strategy](
+            test=lambda candidates, kind: self.first_passing(candidates, log, kind),
+            close=self.close,
+            progress=lambda kept: self.logger.info("REDUCED to %s", kept),
+            hierarchy=self.hierarchy,
+            checkpoint=self.checkpoint,
+        )
+        remaining_attrs = minimizer.keep(
+            minimizer.minimize(self.units, fixed=self.fixed, state=state), self.fixed
+        )
 
-                        if self.oracle(coattributes, log):
-                            remaining_attrs, n = coattributes, n - 1
-                            raise Found
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
 
-                n *= 2
+        self.runner.close()
 
-            except Found:
-                self.logger.info("REDUCED to %s", remaining_attrs)
-                continue
+        if self.artifacts is not None:
+            self.artifacts.close()
+            self.artifacts = None
 
         end = time.time()
-        debloat_time = end - start
+        debloat_time = self.resumed_time + end - start
         cmd_message(
             f"Total time taken to debloat {self.module_name}: {debloat_time:.2f}s"
         )
 
         self.logger.info("Remanining attributes: %s", remaining_attrs)
+        self.logger.info("Oracle calls: %s", self.iterations)
+        self.logger.info("Candidates that did not compile: %s", self.compile_errors)
+        self.logger.info("Oracle cache: %s", self.cache.summary())
 
         attrs_after = len(remaining_attrs)
         removed = attrs_before - attrs_after
         cmd_message(
-            f"Removed {removed} attributes {(removed / all_attributes * 100):.2f}%."
+            f"Removed {removed} attributes {(removed / all_attributes * 100):.2f}% "
+            f"with {self.iterations} oracle calls."
+        )
+        if self.compile_errors:
+            cmd_message(
+                f"{self.compile_errors} candidates did not compile, see "
+                f"log/{self.module_name}_delta.log",
+                "warning",
+            )
+
+        delta_record = DeltaRecord(
+            (debloat_time, all_attributes, attrs_after, self.iterations)
         )
 
-        delta_record = DeltaRecord((debloat_time, all_attributes, attrs_after))
+        kept = list(dict.fromkeys(list(self.marked_attrs) + remaining_attrs))
+        return kept, delta_record
 
-        return list(self.marked_attrs) + remaining_attrs, delta_record
+    def lazy_imports(self, attributes):
+        """
+        Choose the kept imports to load lazily. The imports that can be lazy
+        are ranked by the time the application spends importing their
+        modules before its handler is invoked. They are made lazy if the
+        oracle still passes, and kept lazy only if their modules are no
+        longer imported before the handler is invoked.
+
+        :param attributes: The attributes that the module keeps
+        :return: The names to import lazily
+        """
+        candidates = self.moduifier.snapshot.lazy_candidates(attributes)
+        if not candidates:
+            return []
+        targets = self.moduifier.snapshot.import_targets(candidates)
+
+        cmd_message(f"Looking for lazy imports in module {self.module_name}")
+
+        lazy_dir = self.moduifier.backup_dir + "/lazy"
+        mkdirp(lazy_dir)
+        candidate = lazy_dir + "/" + self.moduifier.basename
+        overrides = {self.module_name: candidate}
+
+        def check(lazy):
+            """
+            Run the oracle with the names imported lazily, and return the
+            import events of a traced run if it passes, or None
+            """
+            self.logger.info("Trying lazy imports %s", lazy)
+            try:
+                self.moduifier.modify(attributes, path=candidate, lazy=lazy)
+            except Exception as e:
+                self.logger.error("Error modifying module: %s", e)
+                return None
+
+            if self.runner.run(overrides=overrides).returncode != 0:
+                return None
+            return self.runner.trace_imports(overrides)
+
+        def modules(name, imports):
+            """
+            The startup imports of the module that a name comes from and of
+            its submodules
+            """
+            for target in targets.get(name, []):
+                found = [
+                    module
+                    for module in imports
+                    if module == target or module.startswith(target + ".")
+                ]
+                if found:
+                    return found
+            return []
+
+        eager = check([])
+        if eager is None:
+            self.logger.error("The debloated module fails the oracle")
+            return []
+
+        imports, eager_startup = startup_imports(eager)
+        costs = {
+            name: covered_time(imports[module] for module in modules(name, imports))
+            for name in candidates
+        }
+        ranked = sorted(
+            (name for name in candidates if costs[name] > 0),
+            key=lambda name: -costs[name],
+        )
+        self.logger.info("Startup import time of lazy candidates: %s", costs)
+
+        # Try all the candidates at once, then one at a time
+        lazy = ranked
+        trace = check(lazy) if lazy else None
+        if trace is None:
+            lazy, trace = [], eager
+            for name in ranked:
+                events = check(lazy + [name])
+                if events is not None:
+                    lazy, trace = lazy + [name], events
+
+        # Names whose modules are still imported at startup save nothing
+        imports, _ = startup_imports(trace)
+        cold = [name for name in lazy if not modules(name, imports)]
+        if cold != lazy:
+            events = check(cold)
+            if events is not None:
+                lazy, trace = cold, events
+
+        self.runner.close()
+
+        if not lazy:
+            cmd_message(f"No lazy imports in module {self.module_name}")
+            return []
+
+        _, lazy_startup = startup_imports(trace)
+        self.logger.info("Lazy imports: %s", lazy)
+        self.logger.info(
+            "Startup time: %s s eagerly, %s s lazily", eager_startup, lazy_startup
+        )
+        cmd_message(
+            f"Importing {', '.join(lazy)} lazily saves "
+            f"{(eager_startup - lazy_startup) / MS:.2f}ms of cold start "
+            f"({eager_startup / MS:.2f}ms -> {lazy_startup / MS:.2f}ms)",
+            "success",
+        )
+
+        return lazy
 
     def get_attr_stats(self):
         """
@@ -200,12 +614,13 @@ class DeltaDebugger:
         """
         return self.iterations
 
-    def finalize_module(self, attributes, local=False):
+    def finalize_module(self, attributes, local=False, lazy=()):
         """
         Finalize the module by removing a set of attributes
 
         :param attributes: The attributes to remove
         :param local: In local environment, restore the original directory
+        :param lazy: Kept names whose imports run on first access
         """
 
         m_path = self.moduifier.module_path
@@ -213,7 +628,7 @@ class DeltaDebugger:
         if self.moduifier.ast is None:
             return m_path
 
-        m_ast = self.moduifier.modify(attributes, remove=False)
+        new_source = self.moduifier.modify(attributes, remove=False, lazy=lazy)
 
         basename = self.moduifier.basename
         log_mod_dir = "log/" + self.module_name
@@ -225,10 +640,14 @@ class DeltaDebugger:
                 file.write(f"{item}\n")
             file.flush()
 
+        if lazy:
+            with open(log_mod_dir + "/lazy.txt", "w", encoding="utf-8") as file:
+                for item in lazy:
+                    file.write(f"{item}\n")
+
         # Log the modified and the original __init__.py files
         mod_init_path = log_mod_dir + "/" + basename
         with open(mod_init_path, "w", encoding="utf-8") as file:
-            new_source = ast.unparse(m_ast)
             file.write(new_source)
             file.flush()
 
@@ -248,4 +667,11 @@ class DeltaDebugger:
         with open(m_path, "a") as file:
             file.write("\n# Debloated\n")
 
+        # Ship the module with bytecode for every optimization level, so
+        # that importing it never has to compile it
+        try:
+            self.moduifier.compile_module(optimize=(0, 1, 2))
+        except py_compile.PyCompileError as e:
+            self.logger.error("Error compiling the debloated module: %s", e)
+
         return m_path
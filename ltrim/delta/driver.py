@@ -1,6 +1,520 @@
 import argparse
+import base64
+import contextlib
+import hashlib
+import importlib
+import importlib.abc
+import importlib.machinery
 import importlib.util
+import io
 import json
+import marshal
+import os
+import resource
+import signal
+import sys
+import tempfile
+import time
+import traceback
+from types import MethodType, ModuleType
+
+# Prefix of the status line that the driver writes last to stderr
+STATUS_PREFIX = "ltrim-driver-status: "
+
+
+class OverrideLoader(importlib.abc.SourceLoader):
+    """
+    Loader that executes a module from its original location, but with the
+    source code of a candidate file. The module keeps its original __file__
+    and __path__, so relative imports and data files keep working. If the
+    candidate has a hash-based bytecode cache that matches its source, the
+    code is loaded from it.
+
+    :param fullname: The name of the module
+    :param path: The original path of the module
+    :param candidate: The path to the candidate source
+    """
+
+    def __init__(self, fullname, path, candidate):
+        self.name = fullname
+        self.path = path
+        self.candidate = candidate
+
+    def get_filename(self, fullname):
+        return self.path
+
+    def get_data(self, path):
+        # path_stats is not implemented, so the bytecode cache of the
+        # original module is never used for the candidate source
+        if path == self.path:
+            path = self.candidate
+        with open(path, "rb") as f:
+            return f.read()
+
+    def get_code(self, fullname):
+        source = self.get_data(self.path)
+
+        try:
+            with open(importlib.util.cache_from_source(self.candidate), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+
+        # Header of a hash-based pyc: magic number, flags and source hash
+        if (
+            data[:4] == importlib.util.MAGIC_NUMBER
+            and int.from_bytes(data[4:8], "little") & 0b1
+            and data[8:16] == importlib.util.source_hash(source)
+        ):
+            return marshal.loads(data[16:])
+
+        return self.source_to_code(source, self.path)
+
+
+class CodeLoader(importlib.abc.SourceLoader):
+    """
+    Loader that executes a module from its original location, but with a
+    code object that was compiled and marshalled before the run. Nothing is
+    read from or written to the module file.
+
+    :param fullname: The name of the module
+    :param path: The original path of the module
+    :param code: The path to the marshalled code object
+    """
+
+    def __init__(self, fullname, path, code):
+        self.name = fullname
+        self.path = path
+        self.code = code
+
+    def get_filename(self, fullname):
+        return self.path
+
+    def get_data(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def get_code(self, fullname):
+        with open(self.code, "rb") as f:
+            return marshal.load(f)
+
+
+class OverrideFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that replaces the source of some modules
+
+    :param overrides: A dictionary from module names to either the path of a
+        candidate source, or {"code": path} with the path of a marshalled code
+        object
+    """
+
+    def __init__(self, overrides):
+        self.overrides = overrides
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in self.overrides:
+            return None
+
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or spec.origin is None:
+            return None
+
+        override = self.overrides[fullname]
+        if isinstance(override, dict):
+            spec.loader = CodeLoader(fullname, spec.origin, override["code"])
+        else:
+            spec.loader = OverrideLoader(fullname, spec.origin, override)
+        return spec
+
+
+class TraceFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that records when the import of each module starts
+    and ends
+
+    :param events: The list to append ("start" | "end", module, time) events
+        to, with the time in seconds of a performance counter
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None or spec.loader is None:
+            return None
+
+        events = self.events
+        loader_exec_module = spec.loader.exec_module
+
+        def traced_exec_module(self, module):
+            events.append(("start", module.__name__, time.perf_counter()))
+            loader_exec_module(module)
+            events.append(("end", module.__name__, time.perf_counter()))
+
+        spec.loader.exec_module = MethodType(traced_exec_module, spec.loader)
+        return spec
+
+
+class TracedModule(ModuleType):
+    """
+    Module class that reports every attribute read from the module, e.g.
+    module.name or from module import name, to the active AttributeFinder
+    """
+
+    tracer = None
+
+    def __getattribute__(self, name):
+        tracer = TracedModule.tracer
+        if tracer is not None:
+            tracer.record(ModuleType.__getattribute__(self, "__name__"), name)
+        return ModuleType.__getattribute__(self, name)
+
+
+class AttributeFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that records which module-level attributes are read
+    from the modules it finds by other code. Once a module is executed, its
+    class is swapped for TracedModule; modules with a class of their own are
+    not traced. Reads are recorded once the handler is invoked, and reads by
+    the application itself, e.g. its from imports, also before.
+
+    :param application: The name of the application module
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.recording = False
+        self.accessed = {}
+        TracedModule.tracer = self
+
+    def start(self):
+        """
+        Record every read from now on
+        """
+        self.recording = True
+
+    def record(self, module, name):
+        """
+        Record a read of an attribute
+
+        :param module: The name of the module
+        :param name: The name of the attribute
+        """
+        if not self.recording:
+            # The frame of the code that reads the attribute
+            reader = sys._getframe(2).f_globals.get("__name__")
+            if reader != self.application:
+                return
+        self.accessed.setdefault(module, set()).add(name)
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None or spec.loader is None:
+            return None
+
+        loader_exec_module = spec.loader.exec_module
+
+        def traced_exec_module(self, module):
+            loader_exec_module(module)
+            if type(module) is ModuleType:
+                module.__class__ = TracedModule
+
+        spec.loader.exec_module = MethodType(traced_exec_module, spec.loader)
+        return spec
+
+
+def load_tests(path):
+    """
+    Load the test cases
+
+    :param path: Path to the test cases file
+    """
+    with open(path) as f:
+        return json.load(f)["tests"]
+
+
+def invoke(handler, entry):
+    """
+    Run the handler on a test case and return everything it would print,
+    including its result
+
+    :param handler: The handler function
+    :param entry: The test case
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        print(handler(entry["event"], entry["context"]))
+    return output.getvalue()
+
+
+def digest(output):
+    """
+    Hash of the output of a test case
+
+    :param output: The output of the test case
+    """
+    return hashlib.sha256(output.encode("utf-8")).hexdigest()
+
+
+def peak_memory():
+    """
+    Peak resident set size and peak virtual memory size of the process,
+    in bytes
+    """
+    peaks = {}
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmHWM", "VmPeak"):
+                    peaks[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+
+    max_rss = peaks.get(
+        "VmHWM", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    )
+    return {"max_rss": max_rss, "vm_peak": peaks.get("VmPeak", max_rss)}
+
+
+def limit_resources(request):
+    """
+    Apply the limits of a request to the current process. The process is
+    killed by SIGALRM once the timeout expires, and allocations beyond the
+    memory limit raise MemoryError.
+
+    :param request: The request with the timeout in seconds and the maximum
+        size of the address space in bytes
+    """
+    timeout = request.get("timeout")
+    if timeout:
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    max_memory = request.get("max_memory")
+    if max_memory:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            max_memory = min(max_memory, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, hard))
+
+
+def run_request(args, request, tests, events=None, before_invoke=None):
+    """
+    Load the application with the requested module overrides and run
+    the test cases. Without expected results, the output of each test case
+    is printed. Otherwise, the outputs are compared as they are produced and
+    the run stops at the first test case that fails.
+
+    :param args: The command line arguments of the driver
+    :param request: The request with the module overrides, the expected
+        hashes of the outputs and the order of the test cases
+    :param tests: The test cases
+    :param events: If set, the list of import events to append a ("load",
+        application, time) event to when the application starts loading,
+        and an ("invoke", handler, time) event to when the first test case
+        starts
+    :param before_invoke: If set, a function to call right before the first
+        test case starts
+    :return: The status of the run
+    """
+    limit_resources(request)
+
+    overrides = request.get("overrides", {})
+    if overrides:
+        sys.meta_path.insert(0, OverrideFinder(overrides))
+
+    file_path = args.filename
+    module_name = file_path.split(".")[0]
+
+    # Find spec from file location
+    spec = importlib.util.spec_from_file_location(module_name, file_path)
+
+    # Load the module from the specification
+    module = importlib.util.module_from_spec(spec)
+
+    if events is not None:
+        events.append(("load", file_path, time.perf_counter()))
+
+    # Execute the module
+    try:
+        spec.loader.exec_module(module)
+    except MemoryError:
+        traceback.print_exc()
+        return {"failed": None, "reason": "memory"}
+
+    handler = getattr(module, args.handler)
+
+    expected = request.get("expected")
+    order = request.get("order") or range(len(tests))
+    hashes = []
+
+    if events is not None:
+        events.append(("invoke", args.handler, time.perf_counter()))
+    if before_invoke is not None:
+        before_invoke()
+
+    for i in order:
+        try:
+            output = invoke(handler, tests[i])
+        except MemoryError:
+            traceback.print_exc()
+            return {"failed": i, "reason": "memory"}
+        except Exception:
+            traceback.print_exc()
+            return {"failed": i, "reason": "exception"}
+
+        if expected is None:
+            sys.stdout.write(output)
+            hashes.append(digest(output))
+        elif digest(output) != expected[i]:
+            return {"failed": i, "reason": "mismatch"}
+
+    return {"hashes": hashes, **peak_memory()} if expected is None else {}
+
+
+def bench(args, request, tests):
+    """
+    Load the application with the requested module overrides, invoke the
+    handler on the first test case, like a cold start, and then invoke it
+    on the test cases in turn, like warm invocations.
+
+    :param args: The command line arguments of the driver, with the number
+        of warm invocations in args.bench
+    :param request: The request with the module overrides and limits
+    :param tests: The test cases
+    :return: The status of the run, with the wall clock time at which the
+        first invocation ended, the time to load the application and of the
+        first invocation, and the latency of every warm invocation, in seconds
+    """
+    limit_resources(request)
+
+    overrides = request.get("overrides", {})
+    if overrides:
+        sys.meta_path.insert(0, OverrideFinder(overrides))
+
+    start = time.perf_counter()
+
+    spec = importlib.util.spec_from_file_location(
+        args.filename.split(".")[0], args.filename
+    )
+    module = importlib.util.module_from_spec(spec)
+
+    try:
+        spec.loader.exec_module(module)
+        handler = getattr(module, args.handler)
+
+        loaded = time.perf_counter()
+        invoke(handler, tests[0])
+        first = time.perf_counter()
+        cold_end = time.time()
+
+        warm = []
+        for i in range(args.bench):
+            invoke_start = time.perf_counter()
+            invoke(handler, tests[i % len(tests)])
+            warm.append(time.perf_counter() - invoke_start)
+    except MemoryError:
+        traceback.print_exc()
+        return {"failed": None, "reason": "memory"}
+    except Exception:
+        traceback.print_exc()
+        return {"failed": None, "reason": "exception"}
+
+    return {
+        "cold_end": cold_end,
+        "load": loaded - start,
+        "first": first - loaded,
+        "warm": warm,
+        **peak_memory(),
+    }
+
+
+def report(status):
+    """
+    Write the status line to stderr and return the exit code of the run
+
+    :param status: The status of the run
+    """
+    sys.stdout.flush()
+    sys.stderr.write(STATUS_PREFIX + json.dumps(status) + "\n")
+    sys.stderr.flush()
+    return 1 if "failed" in status else 0
+
+
+def fork_request(args, request, tests):
+    """
+    Serve a request in a forked child and collect its exit code and output
+
+    :param args: The command line arguments of the driver
+    :param request: The request for the run
+    :param tests: The test cases
+    """
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+
+        if pid == 0:
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out.fileno(), 1)
+            os.dup2(err.fileno(), 2)
+
+            code = 0
+            try:
+                code = report(run_request(args, request, tests))
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+        _, status = os.waitpid(pid, 0)
+
+        out.seek(0)
+        err.seek(0)
+
+        return {
+            "returncode": os.waitstatus_to_exitcode(status),
+            "stdout": base64.b64encode(out.read()).decode("ascii"),
+            "stderr": base64.b64encode(err.read()).decode("ascii"),
+        }
+
+
+def serve(args):
+    """
+    Fork server: pre-import the modules listed in the first line of stdin,
+    then fork a child for every following request line and answer with a
+    JSON line on stdout.
+
+    :param args: The command line arguments of the driver
+    """
+
+    # Keep the protocol channel away from anything the modules print
+    channel = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    tests = load_tests(args.test)
+
+    for name in json.loads(sys.stdin.readline()):
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # The child will import it again and fail on its own
+            pass
+
+    for line in sys.stdin:
+        response = fork_request(args, json.loads(line), tests)
+        channel.write(json.dumps(response) + "\n")
+        channel.flush()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -28,28 +542,74 @@ if __name__ == "__main__":
         type=str,
         default="data.json",
     )
+    parser.add_argument(
+        "--request",
+        help="Read a JSON request for the run from stdin",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serve",
+        help="Run as a fork server that answers requests from stdin",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--bench",
+        help="""Benchmark a cold start and this many warm invocations of the
+        handler instead of checking the test cases""",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-imports",
+        help="""Write the start and end events of every import, and the times
+        the application starts loading and the handler is invoked, to this
+        file""",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-attributes",
+        help="""Write the module-level attributes that the handler and the
+        application read from every module to this file""",
+        type=str,
+        default=None,
+    )
 
     args = parser.parse_args()
 
-    file_path = args.filename
-    module_name = file_path.split(".")[0]
+    if args.serve:
+        serve(args)
+        sys.exit(0)
 
-    # Find spec from file location
-    spec = importlib.util.spec_from_file_location(module_name, file_path)
+    request = json.load(sys.stdin) if args.request else {}
 
-    # Load the module from the specification
-    module = importlib.util.module_from_spec(spec)
+    if args.bench is not None:
+        sys.exit(report(bench(args, request, load_tests(args.test))))
 
-    # Execute the module
-    spec.loader.exec_module(module)
+    events = []
+    if args.trace_imports:
+        sys.meta_path.insert(0, TraceFinder(events))
 
-    handler = getattr(module, args.handler)
+    tracer = None
+    if args.trace_attributes:
+        tracer = AttributeFinder(args.filename.split(".")[0])
+        sys.meta_path.insert(0, tracer)
+
+    status = run_request(
+        args,
+        request,
+        load_tests(args.test),
+        events if args.trace_imports else None,
+        tracer.start if tracer is not None else None,
+    )
+
+    if tracer is not None:
+        TracedModule.tracer = None
+        with open(args.trace_attributes, "w") as f:
+            json.dump({m: sorted(names) for m, names in tracer.accessed.items()}, f)
 
-    # open data.json file
-    with open(args.test) as f:
-        data = json.load(f)
+    if args.trace_imports:
+        with open(args.trace_imports, "w") as f:
+            json.dump(events, f)
 
-        for entry in data["tests"]:
-            event = entry["event"]
-            context = entry["context"]
-            print(handler(event, context))
+    sys.exit(report(status))
@@ -0,0 +1,311 @@
+from ltrim.delta.utils import Found, chunks, flatten
+
+
+class Minimizer:
+    """
+    Base class of the minimization strategies. A strategy searches for a small
+    list of items that still passes the oracle, where every item is a list of
+    attributes that are kept or removed together.
+
+    :param test: Function that runs the oracle on a list of candidates, each a
+        list of attributes to keep, and returns the index of the first passing
+        candidate or None
+    :param close: Function that extends a list of attributes with the
+        attributes they depend on
+    :param progress: Function called with the kept attributes whenever the
+        strategy makes progress
+    :param hierarchy: Function that splits a list of items into coarse groups
+        of item indices and the indices of the remaining items. Only used by
+        hierarchical strategies
+    :param checkpoint: Function called with the JSON-serializable state of the
+        strategy at the start of every round. Passing the state back to
+        minimize resumes the search from that round
+    """
+
+    name = None
+
+    def __init__(self, test, close, progress=None, hierarchy=None, checkpoint=None):
+        self.test = test
+        self.close = close
+        self.progress = progress
+        self.hierarchy = hierarchy
+        self.checkpoint = checkpoint
+
+    def keep(self, items, fixed=()):
+        """
+        Attributes kept for a list of items
+
+        :param items: The items to keep
+        :param fixed: Attributes that are kept in any case
+        """
+        return self.close(list(fixed) + flatten(items))
+
+    def first_passing(self, candidates, current, fixed=(), kind="partition"):
+        """
+        Return the index of the first candidate that passes the oracle,
+        skipping the candidates that keep as many attributes as the current
+        items, or None if no candidate passes
+
+        :param candidates: Lists of items to check
+        :param current: The current list of items
+        :param fixed: Attributes that are kept in any case
+        :param kind: The kind of the candidates, used for logging
+        """
+        size = len(self.keep(current, fixed))
+
+        indices, attributes = [], []
+        for i, items in enumerate(candidates):
+            kept = self.keep(items, fixed)
+            if len(kept) < size:
+                indices.append(i)
+                attributes.append(kept)
+
+        j = self.test(attributes, kind)
+        return None if j is None else indices[j]
+
+    def reduced(self, items, fixed=()):
+        """
+        Report progress after the current items were reduced
+
+        :param items: The current list of items
+        :param fixed: Attributes that are kept in any case
+        """
+        if self.progress is not None:
+            self.progress(self.keep(items, fixed))
+
+    def save(self, state):
+        """
+        Report the state of the strategy at the start of a round
+
+        :param state: The state of the strategy
+        """
+        if self.checkpoint is not None:
+            self.checkpoint(state)
+
+    def minimize(self, items, fixed=(), state=None):
+        """
+        Return a small list of items that passes the oracle
+
+        :param items: The items to minimize
+        :param fixed: Attributes that are kept in any case
+        :param state: A state saved by an earlier run on the same items
+        """
+        raise NotImplementedError
+
+
+class DDMin(Minimizer):
+    """
+    Classic ddmin: check the n partitions of the items and their complements,
+    and double n, up to the number of items, if none of them passes.
+    """
+
+    name = "ddmin"
+
+    def minimize(self, items, fixed=(), state=None):
+        state = state or {"current": list(range(len(items))), "n": 2}
+        current, n = state["current"], state["n"]
+
+        def select(indices):
+            return [items[i] for i in indices]
+
+        while n <= len(current):
+            self.save({"current": current, "n": n})
+
+            us = list(chunks(current, n))
+
+            try:
+                i = self.first_passing([select(u) for u in us], select(current), fixed)
+                if i is not None:
+                    current, n = us[i], 2
+                    raise Found
+
+                if n > 2:
+                    cos = []
+                    for i in range(n):
+                        counits = us.copy()
+                        counits.pop(i)
+                        cos.append(flatten(counits))
+
+                    i = self.first_passing(
+                        [select(c) for c in cos],
+                        select(current),
+                        fixed,
+                        kind="c-partition",
+                    )
+                    if i is not None:
+                        current, n = cos[i], n - 1
+                        raise Found
+
+                # The last round checks every item on its own
+                if n == len(current):
+                    break
+                n = min(n * 2, len(current))
+
+            except Found:
+                self.reduced(select(current), fixed)
+                continue
+
+        return select(current)
+
+
+class ProbDD(Minimizer):
+    """
+    Probabilistic Delta Debugging. Every item has a probability of being
+    needed, and every step tries to remove the set of items with the highest
+    expected gain. A failing step raises the probabilities of the items it
+    tried to remove, so the search learns from the outcomes.
+
+    :param initial_probability: The prior probability that an item is needed
+    """
+
+    name = "probdd"
+
+    def __init__(self, *args, initial_probability=0.1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial_probability = initial_probability
+
+    def minimize(self, items, fixed=(), state=None):
+        state = state or {
+            "current": list(range(len(items))),
+            "probability": [self.initial_probability] * len(items),
+        }
+        current, probability = state["current"], state["probability"]
+
+        while True:
+            self.save({"current": current, "probability": probability})
+
+            removable = sorted(
+                (i for i in current if probability[i] < 1),
+                key=lambda i: (probability[i], i),
+            )
+            if not removable:
+                break
+
+            # Remove the prefix with the highest expected number of removed items
+            best, best_gain, all_removable = 0, 0, 1
+            for k, i in enumerate(removable, start=1):
+                all_removable *= 1 - probability[i]
+                if k * all_removable > best_gain:
+                    best, best_gain = k, k * all_removable
+
+            removed = set(removable[:best])
+            candidate = [i for i in current if i not in removed]
+
+            if (
+                self.first_passing(
+                    [[items[i] for i in candidate]],
+                    [items[i] for i in current],
+                    fixed,
+                    kind="probdd candidate",
+                )
+                is not None
+            ):
+                current = candidate
+                self.reduced([items[i] for i in current], fixed)
+                continue
+
+            none_needed = 1
+            for i in removed:
+                none_needed *= 1 - probability[i]
+            for i in removed:
+                probability[i] = min(1, probability[i] / (1 - none_needed))
+
+        return [items[i] for i in current]
+
+
+class BinaryElimination(Minimizer):
+    """
+    Try to remove chunks of items, starting with all of them. If a chunk
+    cannot be removed, try each half of it instead.
+    """
+
+    name = "binary-elim"
+
+    def minimize(self, items, fixed=(), state=None):
+        state = state or {
+            "current": list(range(len(items))),
+            "pending": [list(range(len(items)))],
+        }
+        current, pending = state["current"], state["pending"]
+
+        while pending:
+            self.save({"current": current, "pending": pending})
+
+            chunk = [i for i in pending.pop(0) if i in current]
+            if not chunk:
+                continue
+
+            candidate = [i for i in current if i not in chunk]
+
+            if (
+                self.first_passing(
+                    [[items[i] for i in candidate]],
+                    [items[i] for i in current],
+                    fixed,
+                    kind="elimination",
+                )
+                is not None
+            ):
+                current = candidate
+                self.reduced([items[i] for i in current], fixed)
+            elif len(chunk) > 1:
+                half = len(chunk) // 2
+                pending[0:0] = [chunk[:half], chunk[half:]]
+
+        return [items[i] for i in current]
+
+
+class HDD(Minimizer):
+    """
+    Hierarchical Delta Debugging. ddmin first decides which coarse groups of
+    items to keep, e.g. all the names imported from a submodule, or a class,
+    while keeping every other item. It then runs on the items of the kept
+    groups together with the other items.
+    """
+
+    name = "hdd"
+
+    def minimize(self, items, fixed=(), state=None):
+        state = state or {"level": 1, "kept": None, "inner": None}
+        groups, others = self.hierarchy(items)
+
+        if state["level"] == 1:
+            # Level 1: whole groups, with every other item fixed
+            ddmin = DDMin(
+                self.test,
+                self.close,
+                self.progress,
+                checkpoint=lambda inner: self.save(
+                    {"level": 1, "kept": None, "inner": inner}
+                ),
+            )
+            coarse = [flatten(items[i] for i in group) for group in groups]
+            kept = ddmin.minimize(
+                coarse, list(fixed) + flatten(items[i] for i in others), state["inner"]
+            )
+            # Groups are disjoint, so they are told apart by their items, not
+            # by the identity of the lists that ddmin returns
+            kept = {tuple(merged) for merged in kept}
+            state = {
+                "level": 2,
+                "kept": [g for g, merged in enumerate(coarse) if tuple(merged) in kept],
+                "inner": None,
+            }
+
+        # Level 2: the items of the kept groups and the other items
+        kept_groups = state["kept"]
+        ddmin = DDMin(
+            self.test,
+            self.close,
+            self.progress,
+            checkpoint=lambda inner: self.save(
+                {"level": 2, "kept": kept_groups, "inner": inner}
+            ),
+        )
+        remaining = sorted(flatten(groups[g] for g in kept_groups) + others)
+        return ddmin.minimize([items[i] for i in remaining], fixed, state["inner"])
+
+
+STRATEGIES = {
+    strategy.name: strategy for strategy in [DDMin, ProbDD, HDD, BinaryElimination]
+}
@@ -1,10 +1,22 @@
+import base64
+import json
 import os
+import signal
 import subprocess
+import sys
+import tempfile
+import threading
 
-from ltrim.utils import Config
+from ltrim.delta.driver import STATUS_PREFIX
+from ltrim.transformers import DefinitionsFinder
+from ltrim.utils import Config, strongly_connected_components
 
 driver_path = os.path.dirname(__file__) + "/driver.py"
 
+# Lower bound of the oracle timeout, so that short baselines do not make
+# runs fail on scheduling noise
+MIN_TIMEOUT = 2.0
+
 
 class Found(Exception):
     pass
@@ -24,25 +36,289 @@ class PyLambdaRunner:
         self.handler = config.handler
         self.test_cases = config.test_cases
 
-    def run(self):
-        try:
-            process = subprocess.run(
-                [
-                    "python",
-                    driver_path,
-                    self.file_path,
-                    "--handler",
-                    self.handler,
-                    "--test",
-                    self.test_cases,
-                ],
+        # Fork servers, one per worker slot, and the modules they pre-import
+        self.servers = {}
+        self.preload = None
+
+        # Hashes of the original output of every test case, and the order
+        # in which the test cases run, most recently failed first
+        self.expected = None
+        self.order = None
+        self.lock = threading.Lock()
+
+        # Limits of the runs, as multiples of the wall time and of the peak
+        # memory of the original run
+        self.timeout_factor = config.timeout_factor
+        self.memory_factor = config.memory_factor
+        self.timeout = None
+        self.max_memory = None
+
+    def command(self, *flags):
+        """
+        Command line to run the driver
+
+        :param flags: Extra flags for the driver
+        """
+        return [
+            # The driver loads code objects compiled by this interpreter
+            sys.executable,
+            driver_path,
+            self.file_path,
+            "--handler",
+            self.handler,
+            "--test",
+            self.test_cases,
+            *flags,
+        ]
+
+    def run(self, overrides=None, slot=0):
+        """
+        Run the test cases in a fresh interpreter, or in a child forked from
+        the fork server of the slot if serve() was called.
+
+        :param overrides: A dictionary from module names to paths of candidate
+            sources that are imported instead of the installed modules
+        :param slot: The worker slot that runs the test cases
+        """
+        request = {"overrides": overrides or {}}
+
+        if self.expected is not None:
+            with self.lock:
+                request["expected"] = self.expected
+                request["order"] = list(self.order)
+
+        if self.timeout is not None:
+            request["timeout"] = self.timeout
+        if self.max_memory is not None:
+            request["max_memory"] = self.max_memory
+
+        if self.preload is not None:
+            process = self.request(request, slot)
+        else:
+            try:
+                process = subprocess.run(
+                    self.command("--request"),
+                    input=json.dumps(request).encode("utf-8"),
+                    capture_output=True,
+                    check=True,
+                    # The driver stops itself when the timeout expires, this
+                    # only catches a driver that does not
+                    timeout=2 * self.timeout if self.timeout else None,
+                )
+            except subprocess.CalledProcessError as e:
+                process = e
+            except subprocess.TimeoutExpired as e:
+                process = subprocess.CompletedProcess(
+                    e.cmd, -signal.SIGALRM, e.stdout or b"", e.stderr or b""
+                )
+
+        failed = driver_status(process).get("failed")
+        if failed is not None and self.order is not None:
+            # Start with this test case next time, it is likely to fail again
+            with self.lock:
+                self.order.remove(failed)
+                self.order.insert(0, failed)
+
+        return process
+
+    def expect(self, process, elapsed):
+        """
+        Compare the following runs test case by test case against the
+        output of a successful run, stopping at the first difference. The
+        following runs are also stopped once they take much longer or use
+        much more memory than this one.
+
+        :param process: The successful run
+        :param elapsed: The wall time of the successful run, in seconds
+        """
+        status = driver_status(process)
+
+        self.expected = status["hashes"]
+        self.order = list(range(len(self.expected)))
+
+        if self.timeout_factor > 0:
+            self.timeout = max(MIN_TIMEOUT, self.timeout_factor * elapsed)
+        if self.memory_factor > 0 and "vm_peak" in status:
+            self.max_memory = int(self.memory_factor * status["vm_peak"])
+
+    def trace_imports(self, overrides=None):
+        """
+        Run the test cases once and return the start and end events of
+        every import, in order, together with the events that mark when the
+        application starts loading and when the handler is first invoked.
+
+        :param overrides: A dictionary from module names to paths of candidate
+            sources that are imported instead of the installed modules
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            trace = tmp + "/imports.json"
+            subprocess.run(
+                self.command("--request", "--trace-imports", trace),
+                input=json.dumps({"overrides": overrides or {}}).encode("utf-8"),
                 capture_output=True,
                 check=True,
             )
+            with open(trace, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    def trace_attributes(self):
+        """
+        Run the test cases once and return the module-level attributes that
+        the handler and the application read from every module
+
+        :return: A dictionary from module names to lists of attribute names,
+            and the status of the run. The dictionary is None if the test cases
+            failed.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            trace = tmp + "/attributes.json"
+            process = subprocess.run(
+                self.command("--trace-attributes", trace),
+                capture_output=True,
+            )
+            status = driver_status(process)
+            if process.returncode != 0 or "failed" in status:
+                return None, status
+
+            with open(trace, "r", encoding="utf-8") as f:
+                return json.load(f), status
 
-            return process
-        except subprocess.CalledProcessError as e:
-            return e
+    def serve(self, module_name):
+        """
+        Run the following test cases in fork servers. A server pre-imports
+        every module whose import finishes before the import of the module
+        under test starts, which excludes the module, its submodules and every
+        module that imports it.
+
+        :param module_name: The name of the module under test
+        """
+        self.preload = preload_modules(self.trace_imports(), module_name)
+
+    def request(self, request, slot):
+        """
+        Send a request to the fork server of a slot and wait for the result
+
+        :param request: The request with the module overrides
+        :param slot: The worker slot
+        """
+        server = self.servers.get(slot)
+
+        if server is None or server.poll() is not None:
+            server = subprocess.Popen(
+                self.command("--serve"),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            server.stdin.write(json.dumps(self.preload).encode("utf-8") + b"\n")
+            self.servers[slot] = server
+
+        try:
+            server.stdin.write(json.dumps(request).encode("utf-8") + b"\n")
+            server.stdin.flush()
+            response = json.loads(server.stdout.readline())
+        except (OSError, ValueError):
+            # The server died, a new one is started on the next request
+            server.kill()
+            return subprocess.CompletedProcess(
+                server.args, 1, b"", b"The fork server exited unexpectedly"
+            )
+
+        return subprocess.CompletedProcess(
+            server.args,
+            response["returncode"],
+            base64.b64decode(response["stdout"]),
+            base64.b64decode(response["stderr"]),
+        )
+
+    def close(self):
+        """
+        Stop the fork servers
+        """
+        for server in self.servers.values():
+            server.stdin.close()
+            server.wait()
+        self.servers = {}
+
+
+def driver_status(process):
+    """
+    Parse the status line that the driver writes last to stderr. The status
+    is empty if the driver did not get to write it.
+
+    :param process: The completed driver process
+    """
+    stderr = str(process.stderr or b"", "utf-8", errors="replace")
+    for line in reversed(stderr.splitlines()):
+        if line.startswith(STATUS_PREFIX):
+            return json.loads(line.removeprefix(STATUS_PREFIX))
+
+    # The driver was stopped by its timer before it could write the status
+    if process.returncode == -signal.SIGALRM:
+        return {"failed": None, "reason": "timeout"}
+    return {}
+
+
+def preload_modules(events, module_name):
+    """
+    Modules whose import finished before the first import of a module started
+
+    :param events: The ("start" | "end", module, time) import events
+    :param module_name: The name of the module
+    """
+    preload = []
+    for kind, name, _ in events:
+        if kind == "start" and (
+            name == module_name or name.startswith(module_name + ".")
+        ):
+            break
+        if kind == "end":
+            preload.append(name)
+    return preload
+
+
+def startup_imports(events):
+    """
+    The imports that start before the handler is first invoked, with the
+    time they start and end, and the startup time of the application, i.e.
+    the time from loading the application to invoking its handler
+
+    :param events: The import events of a traced run
+    :return: A dictionary from modules to their (start, end) times, and the
+        startup time, in seconds
+    """
+    starts, imports = {}, {}
+    load = invoke = None
+
+    for kind, name, at in events:
+        if kind == "load":
+            load = at
+        elif kind == "invoke":
+            invoke = at
+        elif kind == "start" and invoke is None:
+            starts[name] = at
+        elif kind == "end" and name in starts:
+            imports[name] = (starts[name], at)
+
+    if load is None or invoke is None:
+        return imports, None
+    return imports, invoke - load
+
+
+def covered_time(intervals):
+    """
+    Total time covered by a set of possibly nested or overlapping intervals
+
+    :param intervals: The (start, end) intervals
+    """
+    total, reached = 0.0, None
+    for start, end in sorted(intervals):
+        if reached is not None and start < reached:
+            start = reached
+        if end > start:
+            total += end - start
+        reached = end if reached is None else max(reached, end)
+    return total
 
 
 def chunks(xs, n):
@@ -68,3 +344,29 @@ def flatten(lst):
     :param lst: The list to flatten
     """
     return [item for sublist in lst for item in sublist]
+
+
+def attribute_units(module_ast, members):
+    """
+    Group the attributes of a module into units that are kept or removed
+    together. The units are the strongly connected components of the graph of
+    references between the module-level definitions of the module.
+
+    :param module_ast: The AST of the module
+    :param members: The attributes to group
+    :return: The units, the attributes that every attribute references, and
+        the module that every imported attribute comes from
+    """
+    finder = DefinitionsFinder()
+    finder.visit(module_ast)
+
+    names = set(members)
+    dependencies = {
+        member: finder.references.get(member, set()) & names for member in members
+    }
+
+    sources = {
+        member: finder.sources[member] for member in members if member in finder.sources
+    }
+
+    return strongly_connected_components(members, dependencies), dependencies, sources
@@ -1,8 +1,8 @@
 import argparse
 
-from ltrim.moduify.moduifier import Moduify
+from ltrim.moduify.moduifier import Moduify, ModuleSnapshot
 
-__all__ = ["Moduify"]
+__all__ = ["Moduify", "ModuleSnapshot"]
 
 
 def main():
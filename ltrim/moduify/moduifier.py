@@ -5,15 +5,27 @@ Modify modules by removing attributes
 import ast
 import copy
 import importlib
+import importlib.util
 import inspect
 import os
+import py_compile
 import sys
 
-from ltrim.transformers import RemoveAttribute, SetFix
+from ltrim.transformers import LazyImport, RemoveAttribute, SetFix, retrieve_name
 from ltrim.utils import MAGIC_ATTRIBUTES, cp
 
 DEBUG = False
 
+# Statements that RemoveAttribute rewrites as a whole, without visiting the
+# statements inside them
+REWRITTEN_STATEMENTS = (
+    ast.Assign,
+    ast.FunctionDef,
+    ast.ClassDef,
+    ast.Import,
+    ast.ImportFrom,
+)
+
 
 def tag_members(members):
     """
@@ -39,16 +51,346 @@ def tag_members(members):
     return list(map(tag, members))
 
 
+def assignment_names(node):
+    """
+    The names that RemoveAttribute consults to rewrite an assignment: its
+    targets, the function that it calls and the elements of __all__
+
+    :param node: The assignment
+    """
+    candidates = [target for target in node.targets if isinstance(target, ast.Name)]
+    if isinstance(node.value, ast.Call):
+        candidates.append(node.value.func)
+    first = node.targets[0]
+    if isinstance(first, ast.Name) and first.id == "__all__":
+        candidates.extend(getattr(node.value, "elts", []))
+
+    return {name for n in candidates if isinstance(name := retrieve_name(n), str)}
+
+
+def statement_spans(module_ast, source):
+    """
+    Index the statements of a module that RemoveAttribute may rewrite by their
+    byte spans in the source and by the names that may change them
+
+    :param module_ast: The AST of the module
+    :param source: The source the AST was parsed from
+    :return: A list of (start, end, lines, blank_rest, names, node) tuples in
+        source order, where lines is the number of line breaks in the span and
+        blank_rest tells whether only a comment follows the span on its last
+        line
+    """
+    data = source.encode("utf-8")
+
+    # Byte offset of the start of every line
+    offsets = [0]
+    for line in data.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    offsets.append(len(data))
+
+    spans = []
+
+    def visit(node):
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, REWRITTEN_STATEMENTS):
+                visit(child)
+                continue
+
+            # Decorators are part of the statement
+            lineno = child.lineno
+            decorators = getattr(child, "decorator_list", [])
+            if decorators:
+                lineno = min(lineno, decorators[0].lineno)
+
+            start = offsets[lineno - 1] + child.col_offset
+            end = offsets[child.end_lineno - 1] + child.end_col_offset
+            rest = data[end : offsets[child.end_lineno]].strip()
+
+            if isinstance(child, (ast.FunctionDef, ast.ClassDef)):
+                names = {child.name}
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                names = {alias.asname or alias.name for alias in child.names}
+            else:
+                names = assignment_names(child)
+
+            spans.append(
+                (
+                    start,
+                    end,
+                    child.end_lineno - lineno,
+                    not rest or rest.startswith(b"#"),
+                    names,
+                    child,
+                )
+            )
+
+    visit(module_ast)
+
+    return sorted(spans, key=lambda span: span[0])
+
+
+class ModuleSnapshot:
+    """
+    The AST and the source of a module together with the kinds of its
+    removable members. Unlike Moduify, it does not hold the imported module,
+    so it can be pickled and used to build candidate modules in another
+    process.
+
+    :param module_name: Name of the module
+    :param module_ast: The AST of the module
+    :param members: The removable members, tagged as in tag_members
+    :param source: The source the AST was parsed from
+    :param package: Whether the module is a package
+    """
+
+    def __init__(self, module_name, module_ast, members, source=None, package=False):
+        self.module_name = module_name
+        self.ast = module_ast
+        self.members = members
+        self.package = package
+
+        self.source = source
+        self.spans = []
+        if module_ast is not None and source is not None:
+            self.spans = statement_spans(module_ast, source)
+
+    def members_to_remove(self, attributes, remove=False):
+        """
+        The tagged members that a candidate removes
+
+        :param attributes: List of attributes to modify
+        :param remove: If True, remove the attributes, otherwise keep them
+        """
+        if remove:
+            return [
+                (member, kind) for member, kind in self.members if member in attributes
+            ]
+        return [
+            (member, kind) for member, kind in self.members if member not in attributes
+        ]
+
+    def lazy_candidates(self, attributes):
+        """
+        The kept names of module-level imports that can be imported lazily.
+        A module __getattr__ only serves accesses from outside the module, so
+        the names must not be used or bound anywhere else in the module.
+
+        :param attributes: The attributes that the module keeps
+        """
+        if self.ast is None:
+            return []
+
+        bound, used = {}, set()
+        for node in ast.walk(self.ast):
+            if isinstance(node, ast.Name):
+                if isinstance(node.ctx, ast.Load):
+                    used.add(node.id)
+                else:
+                    bound[node.id] = bound.get(node.id, 0) + 1
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                used.update(node.names)
+            elif isinstance(node, ast.alias):
+                name = (node.asname or node.name).split(".")[0]
+                bound[name] = bound.get(name, 0) + 1
+            elif isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                bound[node.name] = bound.get(node.name, 0) + 1
+
+        # An existing __getattr__ would be replaced
+        if "__getattr__" in bound:
+            return []
+
+        candidates = []
+        for statement in self.ast.body:
+            if isinstance(statement, ast.Import):
+                names = [
+                    alias.asname or alias.name.split(".")[0]
+                    for alias in statement.names
+                ]
+            elif isinstance(statement, ast.ImportFrom):
+                names = [alias.asname or alias.name for alias in statement.names]
+            else:
+                continue
+
+            candidates.extend(
+                name
+                for name in names
+                if name in attributes
+                and name not in used
+                and bound[name] == 1
+                and not name.startswith("__")
+                and name not in ("globals", "AttributeError")
+            )
+
+        return candidates
+
+    def import_targets(self, names):
+        """
+        The modules that the module-level imports of some names may load. An
+        import from a module may load the module or its submodule with the
+        imported name.
+
+        :param names: The imported names
+        :return: A dictionary from every name to the absolute names of the
+            modules it may come from, most specific first
+        """
+        package = self.module_name
+        if not self.package:
+            package = package.rpartition(".")[0]
+
+        targets = {}
+        for statement in self.ast.body:
+            if isinstance(statement, ast.Import):
+                for alias in statement.names:
+                    name = alias.asname or alias.name.split(".")[0]
+                    if name in names:
+                        targets[name] = [alias.name]
+
+            elif isinstance(statement, ast.ImportFrom):
+                try:
+                    base = importlib.util.resolve_name(
+                        "." * statement.level + (statement.module or ""), package
+                    )
+                except (ImportError, ValueError):
+                    continue
+                for alias in statement.names:
+                    name = alias.asname or alias.name
+                    if name in names:
+                        targets[name] = [base + "." + alias.name, base]
+
+        return targets
+
+    def transform(self, attributes, remove=False, inplace=False, lazy=()):
+        """
+        Build the AST of the module without the removed attributes
+
+        :param attributes: List of attributes to modify
+        :param remove: If True, remove the attributes, otherwise keep them
+        :param inplace: Transform the cached AST instead of a copy. Only
+            safe if the snapshot is not used again
+        :param lazy: Kept names whose imports run on first access
+        """
+        members_to_remove = self.members_to_remove(attributes, remove)
+
+        module_ast = self.ast if inplace else copy.deepcopy(self.ast)
+
+        remove_transformer = RemoveAttribute(members_to_remove)
+        module_ast = remove_transformer.visit(module_ast)
+
+        # TODO: Just for numpy for now
+        if self.module_name == "numpy":
+            numpyfix = SetFix(members_to_remove)
+            module_ast = numpyfix.visit(module_ast)
+
+        if lazy:
+            lazy_transformer = LazyImport(lazy, self.module_name, self.package)
+            module_ast = lazy_transformer.visit(module_ast)
+            module_ast.body.append(lazy_transformer.getattr_function())
+
+        return module_ast
+
+    def render(self, attributes, remove=False, lazy=()):
+        """
+        Build the source of the module without the removed attributes. Only
+        the statements that change are rewritten, and they are spliced into
+        the original source, which keeps its formatting and line numbers.
+
+        :param attributes: List of attributes to modify
+        :param remove: If True, remove the attributes, otherwise keep them
+        :param lazy: Kept names whose imports run on first access, from a
+            module __getattr__ that is appended to the source
+        """
+        if self.source is None:
+            return ast.unparse(self.transform(attributes, remove, lazy=lazy))
+
+        members_to_remove = self.members_to_remove(attributes, remove)
+        removed = {member for member, _ in members_to_remove}
+
+        remove_transformer = RemoveAttribute(members_to_remove)
+        # TODO: Just for numpy for now
+        numpyfix = SetFix(members_to_remove) if self.module_name == "numpy" else None
+
+        lazy_transformer = LazyImport(lazy, self.module_name, self.package)
+        changed = removed | lazy_transformer.names
+
+        data = self.source.encode("utf-8")
+        pieces = []
+        position = 0
+
+        for start, end, lines, blank_rest, names, node in self.spans:
+            if changed.isdisjoint(names):
+                continue
+
+            # RemoveAttribute either keeps or replaces functions and classes,
+            # only the other statements are changed in place
+            if numpyfix is None and isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                new_node = remove_transformer.visit(node)
+            else:
+                new_node = remove_transformer.visit(copy.deepcopy(node))
+                if numpyfix is not None:
+                    new_node = numpyfix.visit(new_node)
+                if lazy and isinstance(new_node, (ast.Import, ast.ImportFrom)):
+                    new_node = lazy_transformer.visit(new_node)
+
+            if isinstance(new_node, ast.Pass):
+                text = "pass"
+            elif new_node is not node and ast.dump(new_node) != ast.dump(node):
+                indent = " " * node.col_offset
+                text = ast.unparse(new_node).replace("\n", "\n" + indent)
+            else:
+                continue
+
+            # Pad the statement to its original number of lines, with line
+            # continuations if another statement follows it on its last line
+            padding = lines - text.count("\n")
+            if padding > 0:
+                text += ("\n" if blank_rest else " \\\n") * padding
+
+            pieces.append(data[position:start])
+            pieces.append(text.encode("utf-8"))
+            position = end
+
+        pieces.append(data[position:])
+
+        function = lazy_transformer.getattr_function()
+        if function is not None:
+            if not data.endswith(b"\n"):
+                pieces.append(b"\n")
+            pieces.append(b"\n\n" + ast.unparse(function).encode("utf-8") + b"\n")
+
+        return b"".join(pieces).decode("utf-8")
+
+    def compile(self, attributes, filename):
+        """
+        Compile the module without the removed attributes. The code keeps the
+        line numbers of the original source.
+
+        :param attributes: List of attributes to keep
+        :param filename: The filename of the code object
+        """
+        return compile(
+            self.render(attributes, remove=False), filename, "exec", dont_inherit=True
+        )
+
+
 class Moduify:
     """
     Instance of modifier
 
     :param module_name: Name of the module to modify
     :param marked_attributes: Attributes that must be kept
+    :param resume: If set, restore the module from the backup of an
+        interrupted run before loading it
     """
 
-    def __init__(self, module_name, marked_attributes):
+    def __init__(self, module_name, marked_attributes, resume=False):
         self.module_name = module_name
+        self.backup_dir = os.path.abspath("tmp/" + module_name)
+
+        # An interrupted run may have left a candidate in place of the module
+        if resume:
+            self.restore_backup()
 
         # Load the module
         module = importlib.import_module(module_name)
@@ -75,14 +417,42 @@ class Moduify:
 
         # Retrieve the AST of the module or None if it isn't a Python file
         if os.path.splitext(self.module_path)[1] == ".py":
-            self.ast = ast.parse(inspect.getsource(module))
+            self.source = inspect.getsource(module)
+            self.ast = ast.parse(self.source)
         else:
+            self.source = None
             self.ast = None
 
-        # Create a backup directory and copy the module to it
-        self.backup_dir = os.path.abspath("tmp/" + module_name)
+        # Picklable copy of the AST and of the members that can be removed,
+        # which rebuilds candidates without importing the module
+        self.snapshot = ModuleSnapshot(
+            module_name=module_name,
+            module_ast=self.ast,
+            members=tag_members(
+                (member, value)
+                for member, value in self.members.items()
+                if member not in self.needed_attributes
+            ),
+            source=self.source,
+            package=self.basename == "__init__.py",
+        )
+
+        # Copy the module to the backup directory
         cp(self.module_path, self.backup_dir + "/" + self.basename)
 
+    def restore_backup(self):
+        """
+        Copy the backup of the module over the installed module, if there is
+        a backup. The module is not imported.
+        """
+        spec = importlib.util.find_spec(self.module_name)
+        if spec is None or not spec.has_location:
+            return
+
+        backup = self.backup_dir + "/" + os.path.basename(spec.origin)
+        if os.path.exists(backup):
+            cp(backup, spec.origin)
+
     def is_python_module(self):
         """
         Check if the module is a Python file by checking if self.ast is
@@ -91,71 +461,73 @@ class Moduify:
 
         return self.ast is not None
 
-    def modify(self, attributes: list, remove=False):
+    def modify(self, attributes: list, remove=False, path=None, lazy=()):
         """
         Modify the module by removing the attributes
 
         :param attributes: List of attributes to modify
         :param remove: If True, remove the attributes, otherwise keep them
+        :param path: If set, write the modified module to this path and leave
+            the installed module untouched
+        :param lazy: Kept names whose imports run on first access
+        :return: The source of the modified module
         """
 
-        # Compute the members that need to be removed
+        if path is None:
+            path = self.module_path
 
-        # Filter out the attributes that are needed
-        # (magic attributes + marked attributes)
-        filtered_members = [
-            (member, value)
-            for member, value in self.members.items()
-            if member not in self.needed_attributes
-        ]
+            try:
+                # Copy the module from the backup directory
+                cp(self.backup_dir + "/" + self.basename, self.module_path)
+            except Exception as e:
+                print(f"Error copying module source: {e}")
+                sys.exit(1)
 
-        if remove:
-            members_to_remove = [
-                (member, value)
-                for member, value in filtered_members
-                if member in attributes
-            ]
-        else:
-            members_to_remove = [
-                (member, value)
-                for member, value in filtered_members
-                if member not in attributes
-            ]
-
-        try:
-            # Copy the module from the backup directory
-            cp(self.backup_dir + "/" + self.basename, self.module_path)
-        except Exception as e:
-            print(f"Error copying module source: {e}")
-            sys.exit(1)
-
-        module_ast = copy.deepcopy(self.ast)
-
-        remove_transformer = RemoveAttribute(tag_members(members_to_remove))
-        module_ast = remove_transformer.visit(module_ast)
-
-        # TODO: Just for numpy for now
-        if self.module_name == "numpy":
-            numpyfix = SetFix(members_to_remove)
-            module_ast = numpyfix.visit(module_ast)
+        new_source = self.snapshot.render(attributes, remove, lazy)
 
         if DEBUG:
-            print(ast.dump(module_ast, annotate_fields=True, indent=1))
+            print(new_source)
 
         # Write back the modified module
-        with open(self.module_path, "w", encoding="utf-8") as out:
-            new_source = ast.unparse(module_ast)
+        with open(path, "w", encoding="utf-8") as out:
             out.write(new_source)
             out.flush()
 
-        return module_ast
+        # The bytecode is written right away, so a module that does not
+        # compile fails here and the interpreter that runs it does not have
+        # to compile it again
+        self.compile_module(path)
+
+        return new_source
+
+    def compile_module(self, path=None, optimize=(0,)):
+        """
+        Compile a module file to hash-checked bytecode in the __pycache__
+        directory next to it. The code objects carry the path of the
+        installed module.
+
+        :param path: The module file to compile. Defaults to the installed
+            module
+        :param optimize: The optimization levels to write bytecode for
+        :raises py_compile.PyCompileError: If the module does not compile
+        """
+        path = path or self.module_path
+
+        for level in optimize:
+            py_compile.compile(
+                path,
+                dfile=self.module_path,
+                doraise=True,
+                optimize=level,
+                invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+            )
 
     def restore_original_directory(self):
         """
-        Move the backup init file back to the original directory
+        Move the backup of the module file back to its original location
         """
 
-        original_file = self.backup_dir + "/__init__.py"
+        original_file = self.backup_dir + "/" + self.basename
 
         if self.module_name not in sys.stdlib_module_names:
-            cp(original_file, self.module_path + "/__init__.py")
+            cp(original_file, self.module_path)
@@ -1,8 +1,20 @@
+import argparse
+import importlib
 import os
 
 import psutil
 
 import ltrim.profiler.profiler as profiler
+from ltrim.profiler.export import (
+    chrome_trace,
+    collapsed_stacks,
+    diff_reports,
+    diff_stacks,
+    export_report,
+    format_diff,
+    load_report,
+    save_report,
+)
 from ltrim.utils import MB
 
 
@@ -14,4 +26,92 @@ def get_memory_usage():
     return process.memory_info().rss / MB
 
 
-__all__ = ["profiler", "get_memory_usage"]
+__all__ = [
+    "profiler",
+    "get_memory_usage",
+    # Export
+    "chrome_trace",
+    "collapsed_stacks",
+    "diff_reports",
+    "diff_stacks",
+    "export_report",
+    "format_diff",
+    "load_report",
+    "save_report",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="""Profile the import process of Python modules, export
+        the import tree as a Chrome trace and as collapsed stacks for
+        flamegraphs, and compare two profiles."""
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    profile_parser = subparsers.add_parser(
+        "profile",
+        help="""Import modules and write the report to <prefix>.json, the
+        Chrome trace to <prefix>.trace.json and the collapsed stacks to
+        <prefix>.folded.""",
+    )
+    profile_parser.add_argument("modules", nargs="+", help="Modules to import.")
+    profile_parser.add_argument(
+        "-o", "--output", default="profile", help="Prefix of the output files."
+    )
+    profile_parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="Measure memory with tracemalloc instead of the resident set size.",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export a saved report as a Chrome trace and collapsed stacks."
+    )
+    export_parser.add_argument("report", help="The report to export.")
+    export_parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Prefix of the output files. Defaults to the report without .json.",
+    )
+
+    diff_parser = subparsers.add_parser(
+        "diff", help="Compare two saved reports, e.g. before and after debloating."
+    )
+    diff_parser.add_argument("before", help="The report before.")
+    diff_parser.add_argument("after", help="The report after.")
+    diff_parser.add_argument(
+        "-n", "--limit", type=int, default=20, help="Number of modules to show."
+    )
+    diff_parser.add_argument(
+        "--folded",
+        default=None,
+        help="""Also write the differential collapsed stacks to this file, for
+        flamegraph.pl.""",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        before, after = load_report(args.before), load_report(args.after)
+        print(format_diff(diff_reports(before, after), args.limit))
+
+        if args.folded:
+            with open(args.folded, "w", encoding="utf-8") as f:
+                f.write("\n".join(diff_stacks(before, after)) + "\n")
+        return
+
+    if args.command == "profile":
+        profiler.attach(args.tracemalloc)
+        for module in args.modules:
+            importlib.import_module(module)
+        report = dict(profiler.get_report())
+        profiler.detach()
+        output = args.output
+    else:
+        report = load_report(args.report)
+        output = args.output or args.report.removesuffix(".json")
+
+    export_report(report, output)
+    print(f"Wrote {output}.json, {output}.trace.json and {output}.folded")
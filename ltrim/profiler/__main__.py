@@ -0,0 +1,3 @@
+from ltrim.profiler import main
+
+main()
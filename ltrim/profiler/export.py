@@ -0,0 +1,209 @@
+"""
+Export profiler reports as Chrome traces and flamegraphs, and compare them
+"""
+
+import json
+
+
+def modules_of(report):
+    """
+    The module entries of a report, without its totals
+
+    :param report: The profiler report
+    """
+    return {
+        module: entry for module, entry in report.items() if isinstance(entry, dict)
+    }
+
+
+def stacks(report):
+    """
+    The import stack of every module, from the outermost import to the
+    module itself
+
+    :param report: The profiler report
+    :return: A dictionary from modules to their stacks
+    """
+    entries = modules_of(report)
+    result = {}
+
+    for module in entries:
+        stack, parent = [module], entries[module].get("parent")
+        while parent is not None and parent in entries:
+            stack.append(parent)
+            parent = entries[parent].get("parent")
+        result[module] = stack[::-1]
+
+    return result
+
+
+def chrome_trace(report):
+    """
+    Convert a report to the Chrome trace event format, which chrome://tracing
+    and Perfetto can open. Every import is a complete event nested in the
+    import of its parent.
+
+    :param report: The profiler report
+    """
+    entries = modules_of(report)
+    origin = min((entry.get("start", 0) for entry in entries.values()), default=0)
+
+    events = []
+    for module, entry in sorted(entries.items(), key=lambda item: item[1]["order"]):
+        events.append(
+            {
+                "name": module,
+                "cat": "import",
+                "ph": "X",
+                # Timestamps and durations are in microseconds
+                "ts": (entry.get("start", origin) - origin) * 1000,
+                "dur": entry["time"] * 1000,
+                "pid": 1,
+                "tid": 1,
+                "args": {
+                    key: entry[key]
+                    for key in (
+                        "self_time",
+                        "memory",
+                        "self_memory",
+                        "native",
+                        "self_native",
+                    )
+                    if key in entry
+                },
+            }
+        )
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def collapsed_stacks(report):
+    """
+    Convert a report to collapsed stacks, one "outer;inner;module count"
+    line per module with its self time in microseconds as the count, which
+    flamegraph.pl and speedscope can draw
+
+    :param report: The profiler report
+    """
+    entries = modules_of(report)
+    return [
+        f"{';'.join(stack)} {max(0, round(entries[module]['self_time'] * 1000))}"
+        for module, stack in stacks(report).items()
+    ]
+
+
+def diff_stacks(before, after):
+    """
+    Compare two reports as collapsed stacks with two counts, the self time in
+    microseconds before and after, which difffolded.pl produces and
+    flamegraph.pl draws as a differential flamegraph
+
+    :param before: The report before debloating
+    :param after: The report after debloating
+    """
+    counts = {}
+    for index, report in enumerate((before, after)):
+        entries = modules_of(report)
+        for module, stack in stacks(report).items():
+            key = ";".join(stack)
+            counts.setdefault(key, [0, 0])[index] = max(
+                0, round(entries[module]["self_time"] * 1000)
+            )
+
+    return [f"{key} {b} {a}" for key, (b, a) in counts.items()]
+
+
+def diff_reports(before, after):
+    """
+    Compare the modules of two reports
+
+    :param before: The report before debloating
+    :param after: The report after debloating
+    :return: (module, self time before, self time after, memory before,
+        memory after) rows, sorted by the self time that remains after,
+        where a module that is not imported is None
+    """
+    entries_before, entries_after = modules_of(before), modules_of(after)
+
+    rows = []
+    for module in {**entries_before, **entries_after}:
+        b, a = entries_before.get(module), entries_after.get(module)
+        rows.append(
+            (
+                module,
+                b and b["self_time"],
+                a and a["self_time"],
+                b and b["self_memory"],
+                a and a["self_memory"],
+            )
+        )
+
+    return sorted(rows, key=lambda row: (row[2] or 0, row[1] or 0), reverse=True)
+
+
+def format_diff(rows, limit=20):
+    """
+    Format the rows of diff_reports as a table of the hottest imports
+
+    :param rows: The rows to format
+    :param limit: The number of rows to show
+    """
+
+    def cell(value, unit):
+        return "-" if value is None else f"{value:.2f}{unit}"
+
+    lines = [
+        f"{'Module':<40} {'Before':>10} {'After':>10} {'Saved':>10} "
+        f"{'Mem Before':>11} {'Mem After':>10}"
+    ]
+    for module, time_before, time_after, memory_before, memory_after in rows[:limit]:
+        saved = (time_before or 0) - (time_after or 0)
+        lines.append(
+            f"{module:<40} {cell(time_before, 'ms'):>10} {cell(time_after, 'ms'):>10} "
+            f"{cell(saved, 'ms'):>10} {cell(memory_before, 'MB'):>11} "
+            f"{cell(memory_after, 'MB'):>10}"
+        )
+
+    total_before = sum(row[1] or 0 for row in rows)
+    total_after = sum(row[2] or 0 for row in rows)
+    lines.append(
+        f"{'Total':<40} {cell(total_before, 'ms'):>10} {cell(total_after, 'ms'):>10} "
+        f"{cell(total_before - total_after, 'ms'):>10}"
+    )
+    return "\n".join(lines)
+
+
+def save_report(report, path):
+    """
+    Write a report as JSON
+
+    :param report: The profiler report
+    :param path: The path of the JSON file
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f)
+
+
+def load_report(path):
+    """
+    Read a report written by save_report
+
+    :param path: The path of the JSON file
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_report(report, prefix):
+    """
+    Write a report as JSON, as a Chrome trace and as collapsed stacks, to
+    <prefix>.json, <prefix>.trace.json and <prefix>.folded
+
+    :param report: The profiler report
+    :param prefix: The prefix of the paths
+    """
+    save_report(report, prefix + ".json")
+    with open(prefix + ".trace.json", "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(report), f)
+    with open(prefix + ".folded", "w", encoding="utf-8") as f:
+        f.write("\n".join(collapsed_stacks(report)) + "\n")
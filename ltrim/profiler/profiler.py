@@ -1,6 +1,9 @@
+import builtins
+import importlib.util
 import os
 import sys
 import time
+import tracemalloc
 from contextlib import contextmanager
 from importlib.abc import Loader
 from importlib.machinery import PathFinder
@@ -9,38 +12,111 @@ from typing import Sequence
 
 import psutil
 
-from ltrim.utils.constants import MB, MS
+from ltrim.utils.constants import MB, MS, NS
+
+
+def native_mappings():
+    """
+    The file-backed memory mappings of the process, e.g. the shared
+    libraries of extension modules, as a set of (start, end, path) tuples.
+    Empty if /proc/self/maps is not available.
+    """
+    mappings = set()
+    try:
+        with open("/proc/self/maps", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split(maxsplit=5)
+                if len(fields) < 6 or fields[4] == "0":
+                    continue
+                start, _, end = fields[0].partition("-")
+                mappings.add((int(start, 16), int(end, 16), fields[5].rstrip()))
+    except OSError:
+        pass
+    return mappings
 
 
 @contextmanager
-def profiler_context(profiler, operation_name, counter):
+def profiler_context(profiler, operation_name, counter, parent=None, trace=False):
     """
-    Context manager for profiling memory and execution time.
+    Context manager for profiling memory and execution time. The entry of
+    the operation is linked to the entry of its parent operation, and its
+    self time and memory exclude the operations nested in it.
+
+    By default, memory is the change of the resident set size. With trace
+    set, it is the change of the Python memory that tracemalloc traces, and
+    the size of the file-backed mappings that the operation adds, e.g. for
+    shared libraries, is recorded as native memory.
     """
     process = psutil.Process(os.getpid())
-    start_time = time.time()
-    memory_before = process.memory_info().rss
 
-    yield  # This allows the context to be used around any code block
+    def memory():
+        if trace:
+            return tracemalloc.get_traced_memory()[0]
+        return process.memory_info().rss
+
+    entry = {"order": counter, "parent": parent, "children": []}
+    profiler[operation_name] = entry
+    if parent is not None:
+        profiler[parent]["children"].append(operation_name)
+
+    if trace:
+        mappings_before = native_mappings()
+
+    start_time = time.perf_counter_ns()
+    memory_before = memory()
 
-    memory_after = process.memory_info().rss
-    end_time = time.time()
+    try:
+        yield  # This allows the context to be used around any code block
+    except BaseException:
+        # A failed operation, e.g. an optional import that the parent catches,
+        # leaves no entry behind. The operations that completed inside it are
+        # credited to the parent instead
+        del profiler[operation_name]
+        for child in entry["children"]:
+            profiler[child]["parent"] = parent
+        if parent is not None:
+            siblings = profiler[parent]["children"]
+            siblings.remove(operation_name)
+            siblings.extend(entry["children"])
+        raise
 
-    memory_footprint = memory_after - memory_before
-    time_taken = end_time - start_time
+    memory_after = memory()
+    end_time = time.perf_counter_ns()
 
-    profiler[operation_name] = {
-        "order": counter,
-        "memory": memory_footprint / MB,
-        "time": time_taken / MS,
-    }
+    memory_footprint = (memory_after - memory_before) / MB
+    time_taken = (end_time - start_time) * NS / MS
+
+    # Only the operations that completed have costs
+    children = [
+        profiler[child]
+        for child in entry["children"]
+        if child in profiler and "time" in profiler[child]
+    ]
+
+    entry["start"] = start_time * NS / MS
+    entry["memory"] = memory_footprint
+    entry["time"] = time_taken
+    entry["self_memory"] = memory_footprint - sum(c["memory"] for c in children)
+    entry["self_time"] = time_taken - sum(c["time"] for c in children)
+
+    if trace:
+        added = native_mappings() - mappings_before
+        native = sum(end - start for start, end, _ in added) / MB
+        entry["native"] = native
+        entry["self_native"] = native - sum(c["native"] for c in children)
 
 
 def create_profiler_loader(
-    loader: Loader, profiler: dict[str, dict[str, float]], counter: int
+    loader: Loader,
+    profiler: dict[str, dict[str, float]],
+    counter: int,
+    stack: list[str],
+    trace: bool = False,
 ):
     """
-    Create a loader with profiler attached, based on the original loader
+    Create a loader with profiler attached, based on the original loader.
+    The stack holds the modules whose execution is in progress, so the
+    module on top of it is the parent of the module being executed.
     """
 
     loader_exec_module = loader.exec_module
@@ -53,8 +129,15 @@ def create_profiler_loader(
 
         # only record one time
         if module_name not in profiler:
-            with profiler_context(profiler, module_name, counter):
-                loader_exec_module(module)
+            parent = stack[-1] if stack else None
+            stack.append(module_name)
+            try:
+                with profiler_context(profiler, module_name, counter, parent, trace):
+                    loader_exec_module(module)
+            finally:
+                stack.pop()
+            # Tells the modules that come from Python sources apart
+            profiler[module_name]["path"] = getattr(module, "__file__", None)
         else:
             loader_exec_module(module)
 
@@ -63,13 +146,61 @@ def create_profiler_loader(
     return loader
 
 
+def recording_import(edges, original_import):
+    """
+    Create a replacement of __import__ that records an edge from the
+    importing module to every module that an import statement needs, also
+    when they are already loaded, e.g. a, a.b and a.b.c for import a.b.c, or
+    a.b and its submodule a.b.c for from a.b import c.
+
+    :param edges: A dictionary from modules to the set of modules they import,
+        updated in place
+    :param original_import: The __import__ function to wrap
+    """
+
+    def record(name, globals=None, locals=None, fromlist=(), level=0):
+        module = original_import(name, globals, locals, fromlist, level)
+
+        importer = (globals or {}).get("__name__")
+        if importer is None:
+            return module
+
+        target = name
+        if level:
+            try:
+                target = importlib.util.resolve_name(
+                    "." * level + name, globals.get("__package__")
+                )
+            except (ImportError, ValueError):
+                return module
+        target = target.rstrip(".")
+
+        parts = target.split(".")
+        imported = {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+        for attr in fromlist or ():
+            if f"{target}.{attr}" in sys.modules:
+                imported.add(f"{target}.{attr}")
+
+        edges.setdefault(importer, set()).update(imported - {importer})
+        return module
+
+    return record
+
+
 class ProfilerMetaFinder(PathFinder):
     """
-    Custom meta path finder to time the import of modules
+    Custom meta path finder to time the import of modules. The report is
+    a tree of imports: every entry holds its parent and children, and both
+    its cumulative and its self time and memory.
     """
 
     profiler_report: dict[str, dict[str, float]] = {}
     counter = 0
+    stack: list[str] = []
+    trace = False
+    # Import edges recorded by recording_import, and the __import__ it wraps
+    edges: dict[str, set[str]] | None = None
+    original_import = None
 
     @classmethod
     def find_spec(
@@ -87,21 +218,56 @@ class ProfilerMetaFinder(PathFinder):
         if spec and spec.loader:
             cls.counter += 1
             spec.loader = create_profiler_loader(
-                spec.loader, cls.profiler_report, cls.counter
+                spec.loader, cls.profiler_report, cls.counter, cls.stack, cls.trace
             )
         return spec
 
 
-def attach():
+def attach(trace=False, graph=False):
+    """
+    Start profiling imports
+
+    :param trace: Measure memory with tracemalloc instead of the resident
+        set size, and record the native mappings of every import
+    :param graph: Record every import statement, so that the report holds
+        the modules that every module imports, not only the ones it loads
+        first. Slows down the imports a little.
+    """
+    ProfilerMetaFinder.trace = trace
+    if trace:
+        tracemalloc.start()
+    if graph:
+        ProfilerMetaFinder.edges = {}
+        ProfilerMetaFinder.original_import = builtins.__import__
+        builtins.__import__ = recording_import(
+            ProfilerMetaFinder.edges, builtins.__import__
+        )
     sys.meta_path.insert(0, ProfilerMetaFinder())
 
 
 def detach():
     sys.meta_path = [i for i in sys.meta_path if not isinstance(i, ProfilerMetaFinder)]
+    if ProfilerMetaFinder.trace:
+        tracemalloc.stop()
+    if ProfilerMetaFinder.original_import is not None:
+        builtins.__import__ = ProfilerMetaFinder.original_import
+        ProfilerMetaFinder.original_import = None
 
 
 def get_report():
     """
-    Return the profiler report
+    Return the profiler report. If the import statements were recorded,
+    every entry lists the profiled modules that it imports under "imports".
     """
-    return ProfilerMetaFinder.profiler_report
+    report = ProfilerMetaFinder.profiler_report
+
+    if ProfilerMetaFinder.edges is not None:
+        for module, entry in report.items():
+            imports = set(entry["children"]) | ProfilerMetaFinder.edges.get(
+                module, set()
+            )
+            entry["imports"] = sorted(
+                name for name in imports if name in report and name != module
+            )
+
+    return report
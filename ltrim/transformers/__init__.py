@@ -1,5 +1,7 @@
 from ltrim.transformers.ast_transformers import (
+    DefinitionsFinder,
     ImportsFinder,
+    LazyImport,
     RemoveAttribute,
     SetFix,
 )
@@ -13,7 +15,9 @@ __all__ = [
     "retrieve_name",
     "add_tag",
     # AST transformers
+    "DefinitionsFinder",
     "ImportsFinder",
+    "LazyImport",
     "RemoveAttribute",
     "SetFix",
     # constants
@@ -1,4 +1,5 @@
 import ast
+import importlib.util
 
 from ltrim.transformers.utils import retrieve_name
 
@@ -27,6 +28,98 @@ class ImportsFinder(ast.NodeVisitor):
         ast.NodeVisitor.generic_visit(self, node)
 
 
+class DefinitionsFinder(ast.NodeVisitor):
+    """
+    Find the module-level definitions of a Python module and the names that
+    each of them references. The same statements are visited as in
+    RemoveAttribute, i.e. the bodies of compound statements are visited but
+    the bodies of functions and classes are not.
+    """
+
+    def __init__(self):
+        ast.NodeVisitor.__init__(self)
+        self.references = {}
+        # The module that every imported name comes from
+        self.sources = {}
+
+    def define(self, names, node):
+        """
+        Record the names referenced by a node for each name it defines
+        """
+        referenced = {
+            n.id
+            for n in ast.walk(node)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)
+        }
+        for name in names:
+            self.references.setdefault(name, set()).update(referenced - {name})
+
+    def visit_FunctionDef(self, node):
+        """
+        Custom visit_FunctionDef
+        """
+        self.define([node.name], node)
+
+    def visit_AsyncFunctionDef(self, node):
+        """
+        Custom visit_AsyncFunctionDef
+        """
+        self.define([node.name], node)
+
+    def visit_ClassDef(self, node):
+        """
+        Custom visit_ClassDef
+        """
+        self.define([node.name], node)
+
+    def visit_Assign(self, node):
+        """
+        Custom visit_Assign
+        """
+        names = [
+            n.id
+            for target in node.targets
+            for n in ast.walk(target)
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)
+        ]
+        self.define(names, node)
+
+    def visit_AnnAssign(self, node):
+        """
+        Custom visit_AnnAssign
+        """
+        if isinstance(node.target, ast.Name):
+            self.define([node.target.id], node)
+
+    def visit_AugAssign(self, node):
+        """
+        Custom visit_AugAssign
+        """
+        if isinstance(node.target, ast.Name):
+            self.define([node.target.id], node)
+
+    def visit_Import(self, node):
+        """
+        Custom visit_Import
+        """
+        self.define(
+            [alias.asname or alias.name.split(".")[0] for alias in node.names], node
+        )
+        for alias in node.names:
+            name = alias.asname or alias.name.split(".")[0]
+            self.sources[name] = alias.name if alias.asname else name
+
+    def visit_ImportFrom(self, node):
+        """
+        Custom visit_ImportFrom
+        """
+        self.define([alias.asname or alias.name for alias in node.names], node)
+        for alias in node.names:
+            # In "from . import name", the name is a submodule itself
+            source = "." * node.level + (node.module or alias.name)
+            self.sources[alias.asname or alias.name] = source
+
+
 class RemoveAttribute(ast.NodeTransformer):
     """
     Remove attributes from a Python module
@@ -127,6 +220,143 @@ class RemoveAttribute(ast.NodeTransformer):
         return node
 
 
+class LazyImport(ast.NodeTransformer):
+    """
+    Turn the imports of some names into lazy loads. The imports are removed
+    from the module and collected, and getattr_function builds a PEP 562
+    module __getattr__ that runs them when a name is first accessed. As in
+    RemoveAttribute, the bodies of functions and classes are not visited.
+
+    :param names: The names to import lazily
+    :param module_name: The name of the module
+    :param package: Whether the module is a package
+    """
+
+    def __init__(self, names, module_name, package=False):
+        self.names = set(names)
+        self.module_name = module_name
+        self.package = package
+        # The import statement of every lazy name
+        self.imports = {}
+
+    def visit_FunctionDef(self, node):
+        """
+        Custom visit_FunctionDef
+        """
+        return node
+
+    def visit_AsyncFunctionDef(self, node):
+        """
+        Custom visit_AsyncFunctionDef
+        """
+        return node
+
+    def visit_ClassDef(self, node):
+        """
+        Custom visit_ClassDef
+        """
+        return node
+
+    def visit_Import(self, node):
+        """
+        Custom visit_Import
+        """
+        newnames = []
+
+        for alias in node.names:
+            name = alias.asname or alias.name.split(".")[0]
+            if name in self.names:
+                self.imports[name] = ast.Import(names=[alias])
+            else:
+                newnames.append(alias)
+
+        if len(newnames) == 0:
+            return ast.Pass()
+
+        node.names = newnames
+
+        return node
+
+    def visit_ImportFrom(self, node):
+        """
+        Custom visit_ImportFrom
+        """
+        newnames = []
+
+        for alias in node.names:
+            name = alias.asname or alias.name
+            if name in self.names:
+                self.imports[name] = ast.ImportFrom(
+                    module=node.module, names=[alias], level=node.level
+                )
+            else:
+                newnames.append(alias)
+
+        if len(newnames) == 0:
+            return ast.Pass()
+
+        node.names = newnames
+
+        return node
+
+    def self_import(self, node):
+        """
+        Return the name of the submodule that an import from the module
+        itself loads, or None for any other import. Such an import cannot run
+        in __getattr__, since it would look the name up on the module again.
+
+        :param node: The ImportFrom statement of a single name
+        """
+        if node.level == 0:
+            base = node.module
+        else:
+            package = self.module_name
+            if not self.package:
+                package = package.rpartition(".")[0]
+            try:
+                base = importlib.util.resolve_name(
+                    "." * node.level + (node.module or ""), package
+                )
+            except (ImportError, ValueError):
+                return None
+
+        if base != self.module_name:
+            return None
+        return base + "." + node.names[0].name
+
+    def getattr_function(self):
+        """
+        Build the module __getattr__ that runs the collected imports on first
+        access and stores the names in the module, or None if no import was
+        collected
+        """
+        if not self.imports:
+            return None
+
+        lines = ["def __getattr__(name):"]
+        for name, node in self.imports.items():
+            lines.append(f"    if name == {name!r}:")
+
+            submodule = None
+            if isinstance(node, ast.ImportFrom):
+                submodule = self.self_import(node)
+
+            if submodule is None:
+                lines.append(f"        {ast.unparse(node)}")
+            else:
+                lines.append("        import importlib")
+                lines.append(f"        {name} = importlib.import_module({submodule!r})")
+
+            lines.append(f"        globals()[{name!r}] = {name}")
+            lines.append(f"        return {name}")
+
+        lines.append(
+            '    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")'
+        )
+
+        return ast.parse("\n".join(lines)).body[0]
+
+
 class SetFix(ast.NodeTransformer):
     """
     Fix modules with __all__ = list(set(...)) pattern
@@ -10,7 +10,7 @@ def retrieve_name(node):
     if isinstance(node, ast.Attribute):
         value_name = retrieve_name(node.value)
         ret = node.attr
-        if value_name is not None:
+        if isinstance(value_name, str):
             ret = value_name + "." + node.attr
         return ret
     if isinstance(node, ast.Call):
@@ -18,10 +18,13 @@ def retrieve_name(node):
     if isinstance(node, ast.JoinedStr):
         joined = ""
         for val in node.values:
+            # Parts without a name, e.g. {x + 1}, are left out
             if isinstance(val, ast.FormattedValue):
-                joined += retrieve_name(val.value)
+                val = retrieve_name(val.value)
             elif isinstance(val, ast.Constant):
-                joined += val.value
+                val = val.value
+            if isinstance(val, str):
+                joined += val
         return joined
     if isinstance(node, ast.Constant):
         return node.value
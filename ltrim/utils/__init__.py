@@ -1,6 +1,12 @@
 from ltrim.utils._io import cp, mkdirp
+from ltrim.utils.checkpoint import CHECKPOINT_DIR, load_checkpoint, save_checkpoint
 from ltrim.utils.config import Config
-from ltrim.utils.constants import MAGIC_ATTRIBUTES, MB, MS
+from ltrim.utils.constants import MAGIC_ATTRIBUTES, MB, MS, NS
+from ltrim.utils.graph import (
+    immediate_dominators,
+    reachable,
+    strongly_connected_components,
+)
 from ltrim.utils.printing import cmd_message
 from ltrim.utils.stats import DeltaRecord, ModuleRecord, Stats
 
@@ -8,6 +14,7 @@ __all__ = [
     # Constants
     "MB",
     "MS",
+    "NS",
     "MAGIC_ATTRIBUTES",
     # Bash commands
     "cp",
@@ -20,4 +27,12 @@ __all__ = [
     "cmd_message",
     # Configuration class
     "Config",
+    # Graph algorithms
+    "immediate_dominators",
+    "reachable",
+    "strongly_connected_components",
+    # Checkpoints
+    "CHECKPOINT_DIR",
+    "load_checkpoint",
+    "save_checkpoint",
 ]
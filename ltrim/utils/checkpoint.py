@@ -0,0 +1,36 @@
+import json
+import os
+
+# Directory of the checkpoints that a resumed run starts from
+CHECKPOINT_DIR = "log/checkpoint"
+
+
+def save_checkpoint(name, state):
+    """
+    Write a checkpoint atomically, so that an interrupted write never
+    leaves a broken checkpoint behind
+
+    :param name: The name of the checkpoint
+    :param state: The JSON-serializable state to save
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+
+    path = f"{CHECKPOINT_DIR}/{name}.json"
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(name):
+    """
+    Read a checkpoint, or return None if there is none
+
+    :param name: The name of the checkpoint
+    """
+    try:
+        with open(f"{CHECKPOINT_DIR}/{name}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -6,3 +6,12 @@ class Config:
     appname: str
     handler: str
     test_cases: str
+    jobs: int = 1
+    fork_server: bool = False
+    in_memory: bool = False
+    group_attributes: bool = True
+    strategy: str = "ddmin"
+    timeout_factor: float = 10.0
+    memory_factor: float = 2.0
+    resume: bool = False
+    lazy_imports: bool = False
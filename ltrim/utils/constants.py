@@ -1,5 +1,6 @@
 MB = 1024**2
 MS = 1e-3
+NS = 1e-9
 
 MAGIC_ATTRIBUTES = [
     "__name__",
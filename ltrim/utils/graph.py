@@ -0,0 +1,142 @@
+def reachable(sources, edges):
+    """
+    Find all the nodes reachable from a set of nodes, including themselves
+
+    :param sources: The nodes to start from
+    :param edges: A dictionary from every node to its successors
+    """
+    seen = set(sources)
+    stack = list(seen)
+
+    while stack:
+        node = stack.pop()
+        for successor in edges.get(node, ()):
+            if successor not in seen:
+                seen.add(successor)
+                stack.append(successor)
+
+    return seen
+
+
+def strongly_connected_components(nodes, edges):
+    """
+    Find the strongly connected components of a directed graph with an
+    iterative version of Tarjan's algorithm. Every component lists its nodes
+    in the order of `nodes`, and the components are ordered by their first
+    node in `nodes`.
+
+    :param nodes: The nodes of the graph
+    :param edges: A dictionary from every node to its successors
+    """
+    nodes = list(nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    for root in nodes:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges.get(root, ())))]
+
+        while work:
+            node, successors = work[-1]
+
+            for successor in successors:
+                if successor not in position:
+                    continue
+                if successor not in index:
+                    index[successor] = lowlink[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(edges.get(successor, ()))))
+                    break
+                if successor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component, key=position.get))
+
+    return sorted(components, key=lambda component: position[component[0]])
+
+
+def immediate_dominators(root, edges):
+    """
+    Find the immediate dominator of every node reachable from a root, with
+    the iterative algorithm of Cooper, Harvey and Kennedy. A node dominates
+    another if every path from the root to the other node passes through it.
+
+    :param root: The node to start from
+    :param edges: A dictionary from every node to its successors
+    :return: A dictionary from every reachable node to its immediate
+        dominator, and the nodes in postorder. The root is its own dominator
+    """
+    postorder = []
+    visited = {root}
+    work = [(root, iter(edges.get(root, ())))]
+
+    while work:
+        node, successors = work[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                work.append((successor, iter(edges.get(successor, ()))))
+                break
+        else:
+            work.pop()
+            postorder.append(node)
+
+    position = {node: i for i, node in enumerate(postorder)}
+    predecessors = {node: [] for node in postorder}
+    for node in postorder:
+        for successor in edges.get(node, ()):
+            if successor in position:
+                predecessors[successor].append(node)
+
+    idom = {root: root}
+
+    def intersect(a, b):
+        while a != b:
+            while position[a] < position[b]:
+                a = idom[a]
+            while position[b] < position[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for node in reversed(postorder):
+            if node == root:
+                continue
+
+            # The predecessors processed so far, the root may be None
+            processed = [p for p in predecessors[node] if p in idom]
+            dominator = processed[0]
+            for predecessor in processed[1:]:
+                dominator = intersect(predecessor, dominator)
+
+            if node not in idom or idom[node] != dominator:
+                idom[node] = dominator
+                changed = True
+
+    return idom, postorder
@@ -1,7 +1,7 @@
 import csv
 from typing import NewType
 
-DeltaRecord = NewType("DeltaRecord", tuple[float, int, int])
+DeltaRecord = NewType("DeltaRecord", tuple[float, int, int, int])
 
 
 class Stats:
@@ -25,7 +25,16 @@ class Stats:
         """
         self.stats[module] = ModuleRecord(module)
 
-    def set_profiling_stats(self, module, memory, time, before=True):
+    def set_profiling_stats(
+        self,
+        module,
+        memory,
+        time,
+        before=True,
+        native=0,
+        time_variance=0,
+        memory_variance=0,
+    ):
         """
         Set stats after profiling
 
@@ -33,9 +42,14 @@ class Stats:
         :param memory: Memory (in MB)
         :param time: Time (in ms)
         :param before: Whether the profiling happened before or after DD
+        :param native: Native memory mappings (in MB)
+        :param time_variance: Variance of the time over the profiling runs
+        :param memory_variance: Variance of the memory over the profiling runs
         """
         order = "Pre" if before else "Post"
-        self.stats[module].set_profiling_stats(memory, time, order)
+        self.stats[module].set_profiling_stats(
+            memory, time, order, native, time_variance, memory_variance
+        )
 
     def set_debloating_stats(self, module, debloat_record: DeltaRecord):
         """
@@ -55,6 +69,26 @@ class Stats:
         """
         self.stats[module].set_path(path)
 
+    def state(self):
+        """
+        JSON-serializable state of the stats, for checkpoints
+        """
+        return {
+            module: {"stats": record.stats, "path": record.path}
+            for module, record in self.stats.items()
+        }
+
+    def restore(self, state):
+        """
+        Restore the stats of a checkpoint
+
+        :param state: The state of the stats
+        """
+        for module, entry in state.items():
+            self.add_module(module)
+            self.stats[module].stats.update(entry["stats"])
+            self.stats[module].set_path(entry["path"])
+
     def convert_to_csv(self):
         """
         Convert the internal dictionary to a CSV
@@ -64,12 +98,19 @@ class Stats:
         keys = [
             "Module",
             "Pre Memory",
+            "Pre Memory Variance",
+            "Pre Native Memory",
             "Pre Import Time",
+            "Pre Import Time Variance",
             "Post Memory",
+            "Post Memory Variance",
+            "Post Native Memory",
             "Post Import Time",
+            "Post Import Time Variance",
             "Debloat Time",
             "Pre Attributes",
             "Removed Attributes",
+            "Oracle Calls",
             "Path",
         ]
 
@@ -95,26 +136,41 @@ class ModuleRecord:
         self.module_name = module_name
         self.stats = {
             "Pre Memory": 0,
+            "Pre Memory Variance": 0,
+            "Pre Native Memory": 0,
             "Pre Import Time": 0,
+            "Pre Import Time Variance": 0,
             "Post Memory": 0,
+            "Post Memory Variance": 0,
+            "Post Native Memory": 0,
             "Post Import Time": 0,
+            "Post Import Time Variance": 0,
             "Debloat Time": 0,
             "Pre Attributes": 0,
             "Removed Attributes": 0,
+            "Oracle Calls": 0,
             "Path": "",
         }
         self.path = None
 
-    def set_profiling_stats(self, memory, time, order):
+    def set_profiling_stats(
+        self, memory, time, order, native=0, time_variance=0, memory_variance=0
+    ):
         """
         Set stats after profiling
 
         :param memory: Memory (in MB)
         :param time: Time (in ms)
         :param before: Whether the profiling happened before or after DD
+        :param native: Native memory mappings (in MB)
+        :param time_variance: Variance of the time over the profiling runs
+        :param memory_variance: Variance of the memory over the profiling runs
         """
         self.stats[order + " Memory"] = memory
+        self.stats[order + " Memory Variance"] = memory_variance
+        self.stats[order + " Native Memory"] = native
         self.stats[order + " Import Time"] = time
+        self.stats[order + " Import Time Variance"] = time_variance
 
     def set_debloating_stats(self, debloat_record: DeltaRecord):
         """
@@ -123,12 +179,14 @@ class ModuleRecord:
         :param debloat_time: Time taken to debloat the module (in ms)
         :param attributes_before: Number of module's attributes before debloating
         :param attributes_after: Number of module's attributes after debloating
+        :param oracle_calls: Number of times the oracle ran the application
         """
-        debloat_time, attributes_before, attributes_after = debloat_record
+        debloat_time, attributes_before, attributes_after, oracle_calls = debloat_record
 
         self.stats["Debloat Time"] = debloat_time
         self.stats["Pre Attributes"] = attributes_before
         self.stats["Removed Attributes"] = attributes_after
+        self.stats["Oracle Calls"] = oracle_calls
 
     def set_path(self, path):
         """
@@ -146,12 +204,19 @@ class ModuleRecord:
         row = {
             "Module": self.module_name,
             "Pre Memory": self.stats["Pre Memory"],
+            "Pre Memory Variance": self.stats["Pre Memory Variance"],
+            "Pre Native Memory": self.stats["Pre Native Memory"],
             "Pre Import Time": self.stats["Pre Import Time"],
+            "Pre Import Time Variance": self.stats["Pre Import Time Variance"],
             "Post Memory": self.stats["Post Memory"],
+            "Post Memory Variance": self.stats["Post Memory Variance"],
+            "Post Native Memory": self.stats["Post Native Memory"],
             "Post Import Time": self.stats["Post Import Time"],
+            "Post Import Time Variance": self.stats["Post Import Time Variance"],
             "Debloat Time": self.stats["Debloat Time"],
             "Pre Attributes": self.stats["Pre Attributes"],
             "Removed Attributes": self.stats["Removed Attributes"],
+            "Oracle Calls": self.stats["Oracle Calls"],
             "Path": self.path,
         }
 
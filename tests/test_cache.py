@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from ltrim.delta.cache import OracleCache
+
+
+class OracleCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.module = os.path.join(directory.name, "module.py")
+        self.tests = os.path.join(directory.name, "data.json")
+        with open(self.module, "w", encoding="utf-8") as f:
+            f.write("a = b = c = d = 1\n")
+        with open(self.tests, "w", encoding="utf-8") as f:
+            f.write("[]\n")
+
+        self.cache = OracleCache(self.module, self.tests)
+
+    def test_exact_results(self):
+        self.cache.record(["a", "b"], True)
+        self.cache.record(["c"], False, "exit")
+
+        self.assertIs(self.cache.lookup(["b", "a", "a"]), True)
+        self.assertIs(self.cache.lookup(["c"]), False)
+        self.assertIsNone(self.cache.lookup(["a"]))
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_failing_superset_prunes_subsets(self):
+        self.cache.record(["a", "b"], False, "output")
+        self.cache.record(["a", "b", "c"], False, "output")
+
+        self.assertIs(self.cache.lookup(["a"]), False)
+        self.assertIs(self.cache.lookup(["b", "c"]), False)
+        self.assertIsNone(self.cache.lookup(["a", "d"]))
+        self.assertEqual(self.cache.implied, 2)
+        # Only the maximal failing sets are kept
+        self.assertEqual(self.cache.failing, [frozenset("abc")])
+
+    def test_passing_results_do_not_prune(self):
+        self.cache.record(["a", "b", "c"], True)
+
+        self.assertIsNone(self.cache.lookup(["a", "b"]))
+
+    def test_limit_failures_are_not_recorded(self):
+        self.cache.record(["a", "b", "c"], False, "timeout")
+        self.cache.record(["a", "b"], False, "memory")
+
+        self.assertIsNone(self.cache.lookup(["a", "b", "c"]))
+        self.assertIsNone(self.cache.lookup(["a"]))
+        self.assertEqual(self.cache.failing, [])
+
+    def test_restore_checkpoint(self):
+        self.cache.record(["a", "b"], True)
+        self.cache.record(["c", "d"], False, "exit")
+        state = self.cache.state()
+
+        cache = OracleCache(self.module, self.tests)
+
+        self.assertTrue(cache.restore(state))
+        self.assertIs(cache.lookup(["a", "b"]), True)
+        self.assertIs(cache.lookup(["c"]), False)
+        self.assertEqual(cache.reasons, self.cache.reasons)
+
+    def test_restore_skips_limit_failures(self):
+        state = self.cache.state()
+        key = self.cache.key(["a"])
+        state["results"][key] = False
+        state["reasons"][key] = "timeout"
+
+        self.assertTrue(self.cache.restore(state))
+        self.assertIsNone(self.cache.lookup(["a"]))
+
+    def test_restore_rejects_other_contexts(self):
+        self.cache.record(["a"], True)
+        state = self.cache.state()
+
+        cache = OracleCache(self.module, self.tests, marked_attributes=["d"])
+        self.assertFalse(cache.restore(state))
+
+        # Checkpoints without the reasons may hold failures on a limit
+        del state["reasons"]
+        self.assertFalse(self.cache.restore(state))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from ltrim.utils.graph import immediate_dominators, strongly_connected_components
+
+# app imports a and b, which both import c; only a imports d, and d and e
+# import each other
+EDGES = {
+    "app": ["a", "b"],
+    "a": ["c", "d"],
+    "b": ["c"],
+    "d": ["e"],
+    "e": ["d"],
+}
+
+
+class GraphTest(unittest.TestCase):
+    def test_immediate_dominators(self):
+        idom, postorder = immediate_dominators("app", EDGES)
+
+        self.assertEqual(
+            idom,
+            {"app": "app", "a": "app", "b": "app", "c": "app", "d": "a", "e": "d"},
+        )
+        self.assertEqual(postorder[-1], "app")
+        self.assertEqual(set(postorder), set(idom))
+
+    def test_unreachable_nodes(self):
+        idom, _ = immediate_dominators("b", EDGES)
+
+        self.assertEqual(idom, {"b": "b", "c": "b"})
+
+    def test_strongly_connected_components(self):
+        components = strongly_connected_components(["app", "a", "b", "d", "e"], EDGES)
+
+        self.assertEqual(components, [["app"], ["a"], ["b"], ["d", "e"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import ast
+import unittest
+
+from ltrim.moduify.moduifier import ModuleSnapshot, statement_spans
+
+FSTRING_MODULE = """\
+x = 1
+MSG = f"{x + 1} items"
+LABEL = f"{x.real!r:>{x}}"
+Y = (1).bit_length()
+__all__ = ["x", "MSG"]
+"""
+
+
+class StatementSpansTest(unittest.TestCase):
+    def test_fstring_with_expressions(self):
+        spans = statement_spans(ast.parse(FSTRING_MODULE), FSTRING_MODULE)
+        names = [span[4] for span in spans]
+
+        self.assertEqual(names[0], {"x"})
+        self.assertEqual(names[1], {"MSG"})
+        self.assertEqual(names[2], {"LABEL"})
+        self.assertIn("Y", names[3])
+        self.assertEqual(names[4], {"__all__", "x", "MSG"})
+
+    def test_render_removes_fstring_assignment(self):
+        members = [(name, "variable") for name in ("x", "MSG", "LABEL", "Y")]
+        snapshot = ModuleSnapshot(
+            "fstrings", ast.parse(FSTRING_MODULE), members, source=FSTRING_MODULE
+        )
+
+        source = snapshot.render(["x", "LABEL", "Y"])
+
+        self.assertNotIn("MSG =", source)
+        self.assertIn('LABEL = f"{x.real!r:>{x}}"', source)
+        self.assertIn('__all__ = ["x"]', source.replace("'", '"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from ltrim.debloat.scheduler import knapsack, realized_yield
+
+
+class KnapsackTest(unittest.TestCase):
+    def test_best_gain_within_capacity(self):
+        items = [("a", 6.0, 5.0), ("b", 5.0, 4.0), ("c", 4.0, 3.0)]
+
+        # b and c beat a alone, and all three do not fit
+        self.assertEqual(knapsack(items, 7.5), ["b", "c"])
+
+    def test_costs_are_rounded_up(self):
+        items = [("a", 1.0, 0.6), ("b", 1.0, 0.6)]
+
+        self.assertEqual(len(knapsack(items, 1.0, resolution=2)), 1)
+
+    def test_no_capacity(self):
+        self.assertEqual(knapsack([("a", 1.0, 1.0)], 0), [])
+
+
+class RealizedYieldTest(unittest.TestCase):
+    def test_bounds(self):
+        self.assertEqual(realized_yield(10.0, 4.0), 0.6)
+        self.assertEqual(realized_yield(10.0, 12.0), 0.0)
+        self.assertEqual(realized_yield(10.0, -1.0), 1.0)
+        self.assertEqual(realized_yield(0.0, 0.0), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import unittest
+
+from ltrim.delta.strategies import STRATEGIES
+
+ITEMS = [[f"a{i}"] for i in range(8)]
+NEEDED = {"a3", "a5"}
+# Coarse groups of the item indices for hdd, and the remaining items
+GROUPS = ([[0, 1, 2, 3], [4, 5]], [6, 7])
+
+
+def make_minimizer(strategy, needed=NEEDED, calls=None):
+    def test(candidates, kind):
+        if calls is not None:
+            calls.append(kind)
+        for i, kept in enumerate(candidates):
+            if needed <= set(kept):
+                return i
+        return None
+
+    return STRATEGIES[strategy](
+        test, list, progress=None, hierarchy=lambda items: GROUPS
+    )
+
+
+class StrategiesTest(unittest.TestCase):
+    def test_minimal_result(self):
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                result = make_minimizer(strategy).minimize(ITEMS)
+
+                self.assertEqual(sorted(result), [["a3"], ["a5"]])
+
+    def test_fixed_attributes_are_not_searched(self):
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                result = make_minimizer(strategy).minimize(ITEMS, fixed=["a3"])
+
+                self.assertEqual(result, [["a5"]])
+
+    def test_all_items_needed(self):
+        needed = {attr for item in ITEMS for attr in item}
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                result = make_minimizer(strategy, needed).minimize(ITEMS)
+
+                self.assertEqual(result, ITEMS)
+
+    def test_ddmin_last_round_on_single_items(self):
+        # Three items are never split in halves down to single items
+        items = [["a"], ["b"], ["c"]]
+        result = make_minimizer("ddmin", {"a", "c"}).minimize(items)
+
+        self.assertEqual(result, [["a"], ["c"]])
+
+    def test_hdd_drops_unneeded_groups(self):
+        calls = []
+        make_minimizer("hdd", {"a6"}, calls).minimize(ITEMS)
+
+        # Both groups go at once, so no item of them is checked on its own
+        self.assertLess(len(calls), len(ITEMS))
+
+    def test_resume_from_checkpoint(self):
+        for strategy in STRATEGIES:
+            with self.subTest(strategy=strategy):
+                states = []
+                minimizer = make_minimizer(strategy)
+                # Checkpoints are written as JSON
+                minimizer.checkpoint = lambda s, states=states: states.append(
+                    json.dumps(s)
+                )
+                expected = minimizer.minimize(ITEMS)
+
+                result = make_minimizer(strategy).minimize(
+                    ITEMS, state=json.loads(states[1])
+                )
+
+                self.assertEqual(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()